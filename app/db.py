@@ -1,17 +1,348 @@
+import atexit
+import logging
+import os
+import queue
+import socket
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from urllib.parse import urlparse
 
-from utils import read_xlsx
+import metrics
+from urls import canonical_url
+from utils import iter_xlsx_rows
+
+logger = logging.getLogger(__name__)
 
 DATABASE_PATH = "./data/database.db"
 
+# Scraped companies are crawled again once their result is older than this
+RECRAWL_AFTER_DAYS = 30
+
+# Companies whose crawl failed, or found nothing, wait before the next attempt:
+# (first delay, longest delay) in seconds by error class, see errors.py. The
+# delay doubles with every attempt that fails the same way.
+HOUR = 3600
+DAY = 24 * HOUR
+RETRY_POLICY = {
+    "DNS": (7 * DAY, 90 * DAY),
+    "CONNECT": (DAY, 30 * DAY),
+    "TIMEOUT": (6 * HOUR, 7 * DAY),
+    "HTTP_4XX": (7 * DAY, 90 * DAY),
+    "HTTP_5XX": (HOUR, 3 * DAY),
+    "PARSE": (14 * DAY, 90 * DAY),
+    "EMPTY": (14 * DAY, 90 * DAY),
+}
+DEFAULT_RETRY = (HOUR, 7 * DAY)
+
+# Rows of the .xlsx file written per transaction during ingest. Each chunk
+# is looked up with one parameter per RIC, and SQLite before 3.32 allows at
+# most 999 parameters in a statement.
+INGEST_CHUNK_SIZE = 900
+
+# Claimed companies go back to the pool if their worker stops renewing the lease
+LEASE_SECONDS = 600
+HEARTBEAT_INTERVAL = LEASE_SECONDS / 3
+
+# Queued writes are committed together every FLUSH_INTERVAL seconds or as soon
+# as FLUSH_SIZE of them are waiting
+FLUSH_INTERVAL = 0.5
+FLUSH_SIZE = 500
+# A batch that fails, e.g. on a lock held by another crawler process, is
+# retried this many times with a doubling delay before it is dropped
+WRITE_RETRIES = 5
+WRITE_RETRY_DELAY = 0.5
+
+# Statements run for each kind of queued write, with the write's parameters.
+# Kinds are applied in this order inside a batch, so the result of a crawl is
+# always saved before the purpose extracted from it. A result is written to
+# every company sharing the crawled link, see link_key().
+WRITE_STATEMENTS = {
+    "save": (
+        """
+        UPDATE companies
+        SET status = :status,
+            scraped_at = :now,
+            error_class = :error_class,
+            attempts = CASE
+                WHEN :error_class IS NULL THEN 0
+                WHEN error_class IS :error_class THEN attempts + 1
+                ELSE 1
+            END,
+            last_attempt = :now,
+            claimed_by = NULL,
+            lease_expires = NULL
+        WHERE link_key = :key
+        """,
+        """
+        INSERT INTO scraped_data (ric, web_link, status)
+        SELECT ric, :about_url, :status FROM companies WHERE link_key = :key
+        ON CONFLICT(ric) DO UPDATE SET
+            web_link = excluded.web_link,
+            status = excluded.status
+        """,
+    ),
+    "purpose": (
+        """
+        UPDATE scraped_data
+        SET scraped_purpose = :purpose,
+            paragraph = :paragraph,
+            confidence = :confidence,
+            overview = :overview,
+            focus = :focus,
+            inference = :inference
+        WHERE ric IN (
+            SELECT ric FROM companies WHERE link_key = :key
+        )
+        """,
+    ),
+}
+
+# Values found in web_link that are not links at all
+INVALID_LINKS = ("", "ERROR", "EMPTY", "NULL")
+
+
+def link_key(link: str | None) -> str | None:
+    """
+    Key shared by the companies whose links lead to the same page, e.g.
+    share classes or listings of one company written http://www.x.com/ and
+    https://x.com. Sites are crawled and enriched once per key. None for
+    the values that are not links. Links that cannot be parsed, e.g. with a
+    bad port, are their own key so the row still gets claimed and fails.
+    """
+    if link is None or str(link).strip() in INVALID_LINKS:
+        return None
+    link = str(link).strip()
+    try:
+        return canonical_url(link if "://" in link else f"http://{link}")
+    except ValueError:
+        return link.lower()
+
+
+def _retry_at_sql() -> str:
+    """SQL expression of the time a failed company is due again"""
+
+    def delay(first: int, longest: int) -> str:
+        return f"MIN({first} * (1 << MIN(attempts - 1, 16)), {longest})"
+
+    cases = " ".join(
+        f"WHEN '{error_class}' THEN {delay(*policy)}"
+        for error_class, policy in RETRY_POLICY.items()
+    )
+    return f"last_attempt + CASE error_class {cases} ELSE {delay(*DEFAULT_RETRY)} END"
+
+
+RETRY_AT = _retry_at_sql()
+
+# Companies with a usable link, no fresh result and no failure waiting for
+# its retry, takes the scraped_at cutoff and the current time
+PENDING_CONDITION = f"""
+    web_link IS NOT NULL
+    AND web_link NOT IN ({", ".join("?" * len(INVALID_LINKS))})
+    AND (status IS NOT 'SCRAPED' OR scraped_at < ?)
+    AND (error_class IS NULL OR {RETRY_AT} <= ?)
+"""
+
+_FLUSH = "flush"
+_STOP = "stop"
+
 
 def connect_to_db(name: str = DATABASE_PATH) -> sqlite3.Connection:
     try:
         conn = sqlite3.connect(name)
         return conn
     except sqlite3.Error as e:
-        print(e)
+        logger.error("Database error in connect_to_db: %s", e)
+
+
+def _open_connection(name: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(name, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only syncs at checkpoints and is still crash safe
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class WriteBehindStore:
+    """
+    Long-lived connections to the database for the crawlers.
+    Writes are queued and committed by a background thread in batched
+    transactions, so callers never wait on the disk. Reads and the few
+    writes that must be synchronous share a second connection; in WAL mode
+    readers don't block the writer. A batch that fails on a locked database
+    is retried with backoff before it is dropped.
+    """
+
+    def __init__(
+        self,
+        name: str = DATABASE_PATH,
+        flush_interval: float = FLUSH_INTERVAL,
+        flush_size: int = FLUSH_SIZE,
+        retries: int = WRITE_RETRIES,
+        retry_delay: float = WRITE_RETRY_DELAY,
+    ) -> None:
+        self.name = name
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.rows_written = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, params: dict) -> None:
+        """Queue a write, see WRITE_STATEMENTS for the kinds"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="db-writer", daemon=True
+                )
+                self._thread.start()
+        self._queue.put((kind, params))
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = _open_connection(self.name)
+        return self._conn
+
+    def read(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    @contextmanager
+    def immediate(self):
+        """Synchronous transaction holding the write lock from its start"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def flush(self) -> None:
+        """Block until every write queued so far is committed"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        done.wait()
+
+    def close(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        if thread is not None:
+            self._queue.put((_STOP, None))
+            thread.join()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size and batch[-1][0] not in (_FLUSH, _STOP):
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, conn: sqlite3.Connection, batch: list) -> None:
+        writes = {}
+        for kind, params in batch:
+            if kind in WRITE_STATEMENTS:
+                writes.setdefault(kind, []).append(params)
+        if not writes:
+            return
+
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                with conn:
+                    for kind, statements in WRITE_STATEMENTS.items():
+                        rows = writes.get(kind)
+                        if rows:
+                            for statement in statements:
+                                conn.executemany(statement, rows)
+                rows_written = sum(len(rows) for rows in writes.values())
+                self.rows_written += rows_written
+                metrics.DB_ROWS.inc(rows_written)
+                break
+            except sqlite3.Error as e:
+                metrics.ERRORS.inc(stage="db_write", error=type(e).__name__)
+                # Only operational errors, like a locked database, may go away
+                if attempt == self.retries or not isinstance(
+                    e, sqlite3.OperationalError
+                ):
+                    logger.error(
+                        "Database error while writing %d queued writes, dropped: %s",
+                        len(batch),
+                        e,
+                    )
+                    break
+                delay = self.retry_delay * 2**attempt
+                logger.warning(
+                    "Database error while writing %d queued writes, retry in %.1fs: %s",
+                    len(batch),
+                    delay,
+                    e,
+                )
+                time.sleep(delay)
+        elapsed = time.perf_counter() - start
+        self.flushes += 1
+        self.flush_seconds += elapsed
+        metrics.observe("db_write", elapsed)
+
+    def _run(self) -> None:
+        conn = _open_connection(self.name)
+        try:
+            while True:
+                batch = self._collect()
+                self._write(conn, batch)
+                for kind, params in batch:
+                    if kind == _FLUSH:
+                        params.set()
+                if batch[-1][0] == _STOP:
+                    return
+        finally:
+            conn.close()
+
+
+STORE = WriteBehindStore()
+atexit.register(STORE.close)
+
+
+def flush_db() -> None:
+    STORE.flush()
+
+
+def close_db() -> None:
+    """Commit pending writes and close the crawler connections"""
+    STORE.close()
+
+
+def _add_missing_columns(
+    cursor: sqlite3.Cursor, table: str, columns: dict[str, str]
+) -> list[str]:
+    """Add the columns missing from an existing table, return the added ones"""
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    added = []
+    for column, definition in columns.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            added.append(column)
+    return added
 
 
 def create_db_and_table(name: str = DATABASE_PATH) -> None:
@@ -30,6 +361,50 @@ def create_db_and_table(name: str = DATABASE_PATH) -> None:
                 """
             )
 
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_companies_web_link ON companies(web_link)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_companies_status ON companies(status)"
+            )
+
+            added = _add_missing_columns(
+                cursor,
+                "companies",
+                {
+                    "scraped_at": "REAL",
+                    "claimed_by": "TEXT",
+                    "lease_expires": "REAL",
+                    "heartbeat_at": "REAL",
+                    "error_class": "TEXT",
+                    "attempts": "INTEGER NOT NULL DEFAULT 0",
+                    "last_attempt": "REAL",
+                    "link_key": "TEXT",
+                },
+            )
+            if "scraped_at" in added:
+                # Rows scraped before the column existed count as scraped now
+                cursor.execute(
+                    "UPDATE companies SET scraped_at = ? WHERE status = 'SCRAPED'",
+                    (time.time(),),
+                )
+
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_companies_claimed_by ON companies(claimed_by)"
+            )
+
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_companies_link_key ON companies(link_key)"
+            )
+            # Rows written before the column existed, or by older code
+            conn.create_function("link_key", 1, link_key, deterministic=True)
+            cursor.execute(
+                """
+                UPDATE companies SET link_key = link_key(web_link)
+                WHERE link_key IS NULL AND web_link IS NOT NULL
+                """
+            )
+
             conn.commit()
 
             cursor.execute(
@@ -57,7 +432,7 @@ def create_db_and_table(name: str = DATABASE_PATH) -> None:
 
             conn.commit()
     except sqlite3.Error as e:
-        print(e)
+        logger.error("Database error in create_db_and_table: %s", e)
     finally:
         if conn:
             conn.close()
@@ -71,7 +446,7 @@ def get_data_from_db(name: str = DATABASE_PATH) -> list:
         data = cursor.fetchall()
         return data
     except sqlite3.Error as e:
-        print(e)
+        logger.error("Database error in get_data_from_db: %s", e)
     finally:
         if conn:
             conn.close()
@@ -85,30 +460,196 @@ def get_link_from_db(name: str = DATABASE_PATH) -> list:
         data = cursor.fetchall()
         return data
     except sqlite3.Error as e:
-        print(e)
+        logger.error("Database error in get_link_from_db: %s", e)
     finally:
         if conn:
             conn.close()
 
 
-def get_data_status(url: str, name: str = DATABASE_PATH) -> str | None:
+def get_data_status(url: str) -> str | None:
     """
     Return the status string if the company is found, or None if not found.
     """
     try:
-        conn = connect_to_db(name)
-        cursor = conn.cursor()
-        cursor.execute("SELECT status FROM companies WHERE web_link = ?", (url,))
-        row = cursor.fetchone()
-        if row is None:
-            return None
-        return row[0]
+        rows = STORE.read(
+            "SELECT status FROM companies WHERE link_key = ?", (link_key(url),)
+        )
+        return rows[0][0] if rows else None
     except sqlite3.Error as e:
-        print(e)
+        logger.error("Database error in get_data_status: %s", e)
         return None
-    finally:
-        if conn:
-            conn.close()
+
+
+def _recrawl_cutoff(max_age_days: float | None) -> float | None:
+    return None if max_age_days is None else time.time() - max_age_days * 86400
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_companies(
+    worker_id: str,
+    limit: int,
+    run_started: float,
+    lease_seconds: float = LEASE_SECONDS,
+    max_age_days: float | None = RECRAWL_AFTER_DAYS,
+    all_companies: bool = False,
+    after: str = "",
+) -> list:
+    """
+    Atomically claim up to `limit` pending sites for the worker and return
+    one (ric, web_link) for each, in RIC order from the first RIC above
+    `after`. Companies sharing a site (see link_key()) are claimed together
+    and the result saved for one is saved for all. Sites held by another
+    worker are skipped until its lease expires, and rows already attempted
+    since `run_started` are left alone so failures are not retried in a
+    loop within one run. Failures wait for the delay of their error class
+    across runs. With `all_companies`, every site is claimed once whatever
+    its last result, e.g. to replay the page archive.
+    """
+    now = time.time()
+    if all_companies:
+        max_age_days = 0
+    try:
+        with STORE.immediate() as conn:
+            # The first company of each site stands for all of them. Pages
+            # of rows are read along the RIC index from `after`, so a claim
+            # costs the rows it skips rather than a scan of the table.
+            sites = {}
+            while len(sites) < limit:
+                rows = conn.execute(
+                    f"""
+                    SELECT ric, web_link, link_key FROM companies AS c
+                    WHERE ric > ?
+                      AND {PENDING_CONDITION}
+                      AND (scraped_at IS NULL OR scraped_at < ?)
+                      AND link_key IS NOT NULL
+                      AND NOT EXISTS (
+                          SELECT 1 FROM companies AS held
+                          WHERE held.link_key = c.link_key
+                            AND held.claimed_by IS NOT NULL
+                            AND held.lease_expires >= ?
+                      )
+                    ORDER BY ric
+                    LIMIT ?
+                    """,
+                    (
+                        after,
+                        *INVALID_LINKS,
+                        _recrawl_cutoff(max_age_days),
+                        float("inf") if all_companies else now,
+                        run_started,
+                        now,
+                        limit - len(sites),
+                    ),
+                ).fetchall()
+                if not rows:
+                    break
+                for ric, link, key in rows:
+                    sites.setdefault(key, (ric, link))
+                after = rows[-1][0]
+            conn.executemany(
+                """
+                UPDATE companies
+                SET claimed_by = ?, lease_expires = ?, heartbeat_at = ?
+                WHERE link_key = ?
+                """,
+                [(worker_id, now + lease_seconds, now, key) for key in sites],
+            )
+        return list(sites.values())
+    except sqlite3.Error as e:
+        logger.error("Database error in claim_companies: %s", e)
+        return []
+
+
+def claim_batches(
+    batch_size: int = 10, worker_id: str | None = None, all_companies: bool = False
+):
+    """
+    Yield claimed batches of (ric, web_link) until no work is left. Claims
+    move forward through the RICs; at the end one more pass from the start
+    picks up the sites released meanwhile by other workers.
+    """
+    worker_id = worker_id or default_worker_id()
+    run_started = time.time()
+    after = ""
+    while True:
+        rows = claim_companies(
+            worker_id, batch_size, run_started, all_companies=all_companies, after=after
+        )
+        if not rows:
+            if not after:
+                return
+            after = ""
+            continue
+        after = rows[-1][0]
+        yield rows
+
+
+def heartbeat(
+    worker_id: str | None = None, lease_seconds: float = LEASE_SECONDS
+) -> None:
+    """Extend the lease of every company the worker is still working on"""
+    worker_id = worker_id or default_worker_id()
+    now = time.time()
+    try:
+        with STORE.immediate() as conn:
+            conn.execute(
+                """
+                UPDATE companies SET lease_expires = ?, heartbeat_at = ?
+                WHERE claimed_by = ?
+                """,
+                (now + lease_seconds, now, worker_id),
+            )
+    except sqlite3.Error as e:
+        logger.error("Database error in heartbeat: %s", e)
+
+
+def release_claims(worker_id: str | None = None) -> None:
+    """Give back the companies the worker claimed but did not finish"""
+    worker_id = worker_id or default_worker_id()
+    STORE.flush()
+    try:
+        with STORE.immediate() as conn:
+            conn.execute(
+                """
+                UPDATE companies SET claimed_by = NULL, lease_expires = NULL
+                WHERE claimed_by = ?
+                """,
+                (worker_id,),
+            )
+    except sqlite3.Error as e:
+        logger.error("Database error in release_claims: %s", e)
+
+
+def iter_unenriched(batch_size: int = 100):
+    """
+    Yield batches of (ric, web_link, about_url) for the scraped sites that
+    have no purpose yet, one company for each.
+    """
+    last_key = ""
+    while True:
+        try:
+            rows = STORE.read(
+                """
+                SELECT MIN(s.ric), c.web_link, s.web_link, c.link_key
+                FROM scraped_data s JOIN companies c ON c.ric = s.ric
+                WHERE c.link_key > ? AND s.status = 'SCRAPED' AND s.scraped_purpose IS NULL
+                GROUP BY c.link_key
+                ORDER BY c.link_key
+                LIMIT ?
+                """,
+                (last_key, batch_size),
+            )
+        except sqlite3.Error as e:
+            logger.error("Database error in iter_unenriched: %s", e)
+            return
+
+        if not rows:
+            return
+        yield [row[:3] for row in rows]
+        last_key = rows[-1][3]
 
 
 def get_data_from_db_by_status(status: str, name: str = DATABASE_PATH) -> list:
@@ -119,7 +660,7 @@ def get_data_from_db_by_status(status: str, name: str = DATABASE_PATH) -> list:
         data = cursor.fetchall()
         return data
     except sqlite3.Error as e:
-        print(e)
+        logger.error("Database error in get_data_from_db_by_status: %s", e)
     finally:
         if conn:
             conn.close()
@@ -133,7 +674,7 @@ def get_data_from_db_by_link(link: str, name: str = DATABASE_PATH) -> list:
         data = cursor.fetchall()
         return data
     except sqlite3.Error as e:
-        print(e)
+        logger.error("Database error in get_data_from_db_by_link: %s", e)
     finally:
         if conn:
             conn.close()
@@ -147,7 +688,7 @@ def count_data_from_db(name: str = DATABASE_PATH) -> int:
         count = cursor.fetchone()[0]
         return count
     except sqlite3.Error as e:
-        print(e)
+        logger.error("Database error in count_data_from_db: %s", e)
     finally:
         if conn:
             conn.close()
@@ -161,7 +702,7 @@ def get_data_limit_offset(limit: int, offset: int, name: str = DATABASE_PATH) ->
         data = cursor.fetchall()
         return data
     except sqlite3.Error as e:
-        print(e)
+        logger.error("Database error in get_data_limit_offset: %s", e)
     finally:
         if conn:
             conn.close()
@@ -172,12 +713,15 @@ def insert_data(data: list, conn: sqlite3.Connection) -> None:
     try:
         cursor = conn.cursor()
         cursor.executemany(
-            "INSERT INTO companies(ric, company_name, industry_type, web_link) VALUES (?, ?, ?, ?)",
-            data,
+            """
+            INSERT INTO companies(ric, company_name, industry_type, web_link, link_key)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(*row, link_key(row[3])) for row in data],
         )
         conn.commit()
     except sqlite3.Error as e:
-        print(e)
+        logger.error("Database error in insert_data: %s", e)
 
 
 def update_purpose(
@@ -189,104 +733,135 @@ def update_purpose(
     focus: str,
     inference: str,
 ) -> None:
-    try:
-        conn = connect_to_db()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            UPDATE scraped_data
-            SET scraped_purpose = ?,
-                paragraph = ?,
-                confidence = ?,
-                overview = ?,
-                focus = ?,
-                inference = ?
-            WHERE ric = (
-                SELECT ric FROM companies WHERE web_link = ?
-            )
-            """,
-            (purpose, paragraph, confidence, overview, focus, inference, url),
-        )
-
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"Database error in update_purpose: {e}")
-    finally:
-        if conn:
-            conn.close()
-
-
-def save_to_db(url: str, about_url: str, status: str = "SCRAPED") -> None:
+    STORE.submit(
+        "purpose",
+        {
+            "key": link_key(url),
+            "purpose": purpose,
+            "paragraph": paragraph,
+            "confidence": confidence,
+            "overview": overview,
+            "focus": focus,
+            "inference": inference,
+        },
+    )
+
+
+def save_to_db(
+    url: str, about_url: str, status: str = "SCRAPED", error_class: str | None = None
+) -> None:
     """
-    Update the 'companies' table for the given 'url' to set its status,
-    then upsert a row in 'scraped_data' with the discovered about_url and the same status.
+    Update the 'companies' table for every company sharing the given 'url'
+    (see link_key) to set its status, then upsert their rows in
+    'scraped_data' with the discovered about_url and the same status.
+    A company that was not SCRAPED also gets its error class, see errors.py,
+    the status itself if none is given, and one more failed attempt.
+    The write is queued and committed in the background with other results.
     """
-    conn = None
-    try:
-        conn = connect_to_db()
-        cursor = conn.cursor()
-
-        # 1. Find the company's RIC by matching its web_link to url
-        cursor.execute("SELECT ric FROM companies WHERE web_link = ?", (url,))
-        row = cursor.fetchone()
-
-        if not row:
-            print(f"No matching row found in 'companies' for the given URL: {url}")
-            return
-
-        ric = row[0]  # The RIC from the companies table
+    error_class = None if status == "SCRAPED" else error_class or status
+    metrics.SITES.inc(status=status)
+    STORE.submit(
+        "save",
+        {
+            "key": link_key(url),
+            "about_url": about_url,
+            "status": status,
+            "error_class": error_class,
+            "now": time.time(),
+        },
+    )
+
+
+def upsert_companies(rows: list, conn: sqlite3.Connection) -> tuple[int, int, int]:
+    """
+    Insert new companies and update the ones whose name, industry or link
+    changed, in one transaction. A company whose link changed is crawled again.
+    Return the (inserted, updated, unchanged) counts.
+    """
+    # The last occurrence of a RIC wins, like it would with sequential updates
+    rows = {row[0]: tuple(row) for row in rows}
+    placeholders = ", ".join("?" * len(rows))
+    existing = {
+        ric: (name, industry, link)
+        for ric, name, industry, link in conn.execute(
+            f"""
+            SELECT ric, company_name, industry_type, web_link FROM companies
+            WHERE ric IN ({placeholders})
+            """,
+            list(rows),
+        )
+    }
 
-        # 2. Update companies table to set its status
-        cursor.execute("UPDATE companies SET status = ? WHERE ric = ?", (status, ric))
+    new = [row for ric, row in rows.items() if ric not in existing]
+    changed = [
+        row for ric, row in rows.items() if ric in existing and existing[ric] != row[1:]
+    ]
 
-        # 3. Upsert (INSERT or IGNORE + UPDATE) in 'scraped_data' for the same RIC
-        #    We'll first INSERT IGNORE in case there's no row for this RIC,
-        #    then UPDATE to make sure web_link and status reflect the latest info.
-        cursor.execute(
+    with conn:
+        conn.executemany(
             """
-            INSERT OR IGNORE INTO scraped_data (ric, web_link, status)
-            VALUES (?, ?, ?)
+            INSERT INTO companies(ric, company_name, industry_type, web_link, link_key)
+            VALUES (?, ?, ?, ?, ?)
             """,
-            (ric, about_url, status),
+            [(*row, link_key(row[3])) for row in new],
         )
-
-        cursor.execute(
+        conn.executemany(
             """
-            UPDATE scraped_data
-            SET web_link = ?, status = ?
-            WHERE ric = ?
+            UPDATE companies
+            SET company_name = :name,
+                industry_type = :industry,
+                status = CASE WHEN web_link IS :link THEN status ELSE 'Not Scraped' END,
+                error_class = CASE WHEN web_link IS :link THEN error_class END,
+                attempts = CASE WHEN web_link IS :link THEN attempts ELSE 0 END,
+                web_link = :link,
+                link_key = :key
+            WHERE ric = :ric
             """,
-            (about_url, status, ric),
+            [
+                {
+                    "ric": ric,
+                    "name": name,
+                    "industry": industry,
+                    "link": link,
+                    "key": link_key(link),
+                }
+                for ric, name, industry, link in changed
+            ],
         )
 
-        conn.commit()
+    return len(new), len(changed), len(rows) - len(new) - len(changed)
 
-    except sqlite3.Error as e:
-        print(f"Database error in save_to_db: {e}")
-    finally:
-        if conn:
-            conn.close()
 
+def fill_database(file: str, chunk_size: int = INGEST_CHUNK_SIZE) -> dict:
+    """
+    Stream the .xlsx file into 'companies', upserting on the RIC in chunked
+    transactions, so a newer export only touches the rows that changed.
+    """
+    logger.info("Ingesting %s...", file)
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
 
-def fill_database(file: str) -> None:
-    # Connect to the SQLite database
     conn = connect_to_db()
-
-    # Create a cursor object
-    cursor = conn.cursor()
-
-    # Check if the table is empty
-    cursor.execute("SELECT COUNT(*) FROM companies")
-    count = cursor.fetchone()[0]
-
-    if count == 0:
-        print("Filling the database with data from the .xls file...")
-
-        data = read_xlsx(file)
-
-        insert_data(data, conn)
-
-    # Close the connection
-    if conn:
+    try:
+        chunk = []
+        for row in iter_xlsx_rows(file):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                for key, count in zip(counts, upsert_companies(chunk, conn)):
+                    counts[key] += count
+                chunk = []
+
+        if chunk:
+            for key, count in zip(counts, upsert_companies(chunk, conn)):
+                counts[key] += count
+    except sqlite3.Error as e:
+        logger.error("Database error in fill_database: %s", e)
+    finally:
         conn.close()
+
+    logger.info(
+        "Inserted %d, updated %d, unchanged %d companies",
+        counts["inserted"],
+        counts["updated"],
+        counts["unchanged"],
+    )
+    return counts
@@ -0,0 +1,72 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Wall-clock budget of the crawl of one site, shared by all its requests
+SITE_DEADLINE = 60.0
+# Longest connect and read timeouts of one request, shorter when the site's
+# budget is almost spent. The read timeout applies to each read of the socket.
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 10.0
+
+
+class DeadlineExceeded(TimeoutError):
+    """The time budget of the site being crawled is spent"""
+
+
+class Deadline:
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+
+_current: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+@contextmanager
+def site_deadline(seconds: float | None = SITE_DEADLINE):
+    """
+    Scope of the crawl of one site: every request made inside it, in the
+    same thread or task, shares the budget. No budget if seconds is None.
+    """
+    deadline = Deadline(seconds) if seconds else None
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left to the site being crawled, None without a deadline"""
+    deadline = _current.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def expired() -> bool:
+    return remaining() == 0
+
+
+def check(url: str = "") -> None:
+    if expired():
+        raise DeadlineExceeded(url)
+
+
+def timeouts(
+    url: str = "", connect: float = CONNECT_TIMEOUT, read: float = READ_TIMEOUT
+) -> tuple[float, float]:
+    """
+    Connect and read timeouts for a request, cut to the time left to the
+    site. Raise DeadlineExceeded if none is left.
+    """
+    left = remaining()
+    if left is None:
+        return connect, read
+    if left == 0:
+        raise DeadlineExceeded(url)
+    return min(connect, left), min(read, left)
@@ -0,0 +1,311 @@
+import logging
+import threading
+import xml.etree.ElementTree as ET
+import zlib
+from urllib.parse import urljoin
+from urllib.robotparser import RobotFileParser
+
+from matcher import about_score, is_about_url
+from politeness import host_of
+from urls import canonical_url, is_valid_url
+
+logger = logging.getLogger(__name__)
+
+ROBOTS_MAX_BYTES = 512 * 1024
+# Sitemaps read per site, an index counts as one, and the URLs and bytes
+# read from all of them together
+MAX_SITEMAPS = 5
+MAX_SITEMAP_URLS = 50000
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024
+# About-like URLs of the sitemap returned as candidates
+MAX_CANDIDATES = 5
+
+SITEMAP_CONTENT_TYPES = (
+    "application/xml",
+    "text/xml",
+    "application/gzip",
+    "application/x-gzip",
+    "application/octet-stream",
+    "text/plain",
+)
+
+
+class DisallowedByRobots(Exception):
+    """The robots.txt of the host does not allow the crawler on the page"""
+
+
+class Robots:
+    """The rules of one host's robots.txt, everything is allowed without one"""
+
+    def __init__(self, text: str | None = None) -> None:
+        self._parser = RobotFileParser()
+        if text is None:
+            self._parser.allow_all = True
+        else:
+            self._parser.parse(text.splitlines())
+
+    def allowed(self, url: str, user_agent: str = "*") -> bool:
+        return self._parser.can_fetch(user_agent, url)
+
+    def crawl_delay(self, user_agent: str = "*") -> float | None:
+        delay = self._parser.crawl_delay(user_agent)
+        return float(delay) if delay is not None else None
+
+    @property
+    def sitemaps(self) -> list[str]:
+        return self._parser.site_maps() or []
+
+
+class RobotsCache:
+    """robots.txt of every host met in the run, read once per host"""
+
+    def __init__(self) -> None:
+        self._robots: dict[str, Robots] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Robots | None:
+        with self._lock:
+            return self._robots.get(host_of(url))
+
+    def put(self, url: str, robots: Robots) -> None:
+        with self._lock:
+            self._robots[host_of(url)] = robots
+
+    def allowed(self, url: str, user_agent: str = "*") -> bool:
+        """False only if the host's robots.txt was read and disallows the URL"""
+        robots = self.get(url)
+        return robots is None or robots.allowed(url, user_agent)
+
+    def check(self, url: str, user_agent: str = "*") -> None:
+        if not self.allowed(url, user_agent):
+            raise DisallowedByRobots(url)
+
+
+ROBOTS = RobotsCache()
+
+
+class RobotsScanner:
+    """Collect the text of a robots.txt, for the crawlers' streaming readers"""
+
+    def __init__(self) -> None:
+        self._texts: list[str] = []
+
+    @property
+    def done(self) -> bool:
+        return False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._texts)
+
+    def feed(self, data: str) -> None:
+        self._texts.append(data)
+
+    def close(self) -> None:
+        pass
+
+
+class SitemapScanner:
+    """
+    Streaming sitemap reader fed with the raw bytes of the response, gzipped
+    or not. Collects the <loc> of a urlset in `urls`, or of a sitemap index
+    in `sitemaps`, without building the document tree.
+    """
+
+    binary = True
+    content_types = SITEMAP_CONTENT_TYPES
+
+    def __init__(
+        self, max_urls: int = MAX_SITEMAP_URLS, max_bytes: int = MAX_SITEMAP_BYTES
+    ) -> None:
+        self.urls: list[str] = []
+        self.sitemaps: list[str] = []
+        self.is_index = False
+        self.failed = False
+        self.max_urls = max_urls
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._decompressor = None
+        self._started = False
+
+    @property
+    def done(self) -> bool:
+        return (
+            self.failed
+            or len(self.urls) + len(self.sitemaps) >= self.max_urls
+            or self.size >= self.max_bytes
+        )
+
+    def feed(self, chunk: bytes) -> None:
+        if not self._started:
+            self._started = True
+            if chunk[:2] == b"\x1f\x8b":
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        try:
+            if self._decompressor is not None:
+                chunk = self._decompressor.decompress(chunk)
+            self.size += len(chunk)
+            self._parser.feed(chunk)
+            self._read_events()
+        except (ET.ParseError, zlib.error) as e:
+            logger.debug("Invalid sitemap: %s", e)
+            self.failed = True
+
+    def _read_events(self) -> None:
+        for event, element in self._parser.read_events():
+            tag = element.tag.rsplit("}", 1)[-1]
+            if event == "start":
+                if tag == "sitemapindex":
+                    self.is_index = True
+            elif tag == "loc" and element.text:
+                (self.sitemaps if self.is_index else self.urls).append(
+                    element.text.strip()
+                )
+            elif tag in ("url", "sitemap"):
+                element.clear()
+
+    def close(self) -> None:
+        if self.failed:
+            return
+        try:
+            self._parser.close()
+            self._read_events()
+        except ET.ParseError:
+            # A truncated sitemap still gave the URLs read so far
+            pass
+
+
+def robots_url(url: str) -> str:
+    return urljoin(url, "/robots.txt")
+
+
+def sitemap_urls(base_url: str, robots: Robots) -> list[str]:
+    """Sitemaps announced by robots.txt, or the conventional location"""
+    return robots.sitemaps or [urljoin(base_url, "/sitemap.xml")]
+
+
+def about_candidates(urls, robots: Robots, user_agent: str = "*") -> list[str]:
+    """
+    The most about-like of the allowed `urls`, each page once. URLs that
+    can't be parsed, e.g. with a bad port, are left out.
+    """
+    candidates: dict[str, str] = {}
+    for url in urls:
+        if is_valid_url(url) and is_about_url(url) and robots.allowed(url, user_agent):
+            candidates.setdefault(canonical_url(url), url)
+    return sorted(candidates.values(), key=about_score, reverse=True)[:MAX_CANDIDATES]
+
+
+def _apply(url: str, robots: Robots, scheduler, user_agent: str) -> Robots:
+    ROBOTS.put(url, robots)
+    delay = robots.crawl_delay(user_agent)
+    if delay and scheduler is not None:
+        scheduler.set_delay(url, delay)
+    return robots
+
+
+def load_robots(scan, url: str, scheduler=None, user_agent: str = "*") -> Robots:
+    """
+    robots.txt of the URL's host, read with `scan(url, scanner, max_bytes)`
+    the first time. A missing or unreadable file allows everything.
+    """
+    robots = ROBOTS.get(url)
+    if robots is not None:
+        return robots
+
+    scanner = RobotsScanner()
+    try:
+        scan(robots_url(url), scanner, ROBOTS_MAX_BYTES)
+        robots = Robots(scanner.text)
+    except Exception as e:
+        logger.debug("No robots.txt for %s: %s", url, e)
+        robots = Robots()
+    return _apply(url, robots, scheduler, user_agent)
+
+
+async def load_robots_async(fetcher, url: str, user_agent: str) -> Robots:
+    """Async version of load_robots() using the crawler's Fetcher"""
+    robots = ROBOTS.get(url)
+    if robots is not None:
+        return robots
+
+    scanner = RobotsScanner()
+    try:
+        await fetcher.scan(robots_url(url), user_agent, scanner, ROBOTS_MAX_BYTES)
+        robots = Robots(scanner.text)
+    except Exception as e:
+        logger.debug("No robots.txt for %s: %s", url, e)
+        robots = Robots()
+    return _apply(url, robots, fetcher.scheduler, user_agent)
+
+
+class _SitemapWalk:
+    """
+    The sitemaps of one site, children of an index included, read within
+    MAX_SITEMAPS and the URL and byte budget of the whole site. Iterating
+    yields a (sitemap URL, SitemapScanner) pair for the caller to scan; the
+    URLs found so far are kept even if the scan fails midway.
+    """
+
+    def __init__(self, base_url: str, robots: Robots, user_agent: str) -> None:
+        self.robots = robots
+        self.user_agent = user_agent
+        self.pending = sitemap_urls(base_url, robots)
+        self.urls: list[str] = []
+        self.budget = MAX_SITEMAP_BYTES
+
+    def __iter__(self):
+        for _ in range(MAX_SITEMAPS):
+            if (
+                not self.pending
+                or self.budget <= 0
+                or len(self.urls) >= MAX_SITEMAP_URLS
+            ):
+                return
+            sitemap = self.pending.pop(0)
+            if not is_valid_url(sitemap) or not self.robots.allowed(
+                sitemap, self.user_agent
+            ):
+                continue
+
+            scanner = SitemapScanner(MAX_SITEMAP_URLS - len(self.urls), self.budget)
+            yield sitemap, scanner
+            self.budget -= scanner.size
+            self.urls.extend(scanner.urls)
+            # Children of an index that look like they list pages come first
+            self.pending += sorted(
+                scanner.sitemaps, key=lambda url: "page" not in url.lower()
+            )
+
+    def candidates(self) -> list[str]:
+        return about_candidates(self.urls, self.robots, self.user_agent)
+
+
+def discover(scan, base_url: str, scheduler=None, user_agent: str = "*") -> list[str]:
+    """
+    About page candidates of the site from its sitemaps, found through
+    robots.txt, without parsing the homepage. Empty if there is no sitemap
+    or nothing about-like in it.
+    """
+    robots = load_robots(scan, base_url, scheduler, user_agent)
+    walk = _SitemapWalk(base_url, robots, user_agent)
+    for sitemap, scanner in walk:
+        try:
+            scan(sitemap, scanner, scanner.max_bytes)
+        except Exception as e:
+            logger.debug("No sitemap at %s: %s", sitemap, e)
+    return walk.candidates()
+
+
+async def discover_async(fetcher, base_url: str, user_agent: str) -> list[str]:
+    """Async version of discover() using the crawler's Fetcher"""
+    robots = await load_robots_async(fetcher, base_url, user_agent)
+    walk = _SitemapWalk(base_url, robots, user_agent)
+    for sitemap, scanner in walk:
+        try:
+            await fetcher.scan(sitemap, user_agent, scanner, scanner.max_bytes)
+        except Exception as e:
+            logger.debug("No sitemap at %s: %s", sitemap, e)
+    return walk.candidates()
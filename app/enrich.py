@@ -0,0 +1,412 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from dataclasses import dataclass
+from functools import lru_cache
+
+import metrics
+from db import link_key, update_purpose
+from llmcache import LLMCache, cache_key
+from openai import AsyncOpenAI
+from passages import select_passages
+from politeness import TokenBucket
+
+PROMPT_PATH = "prompt.txt"
+BATCH_PROMPT_PATH = "prompt_batch.txt"
+SYSTEM_PROMPT = "You are a cautious assistant extracting company purposes."
+
+LLM_MODEL = os.getenv("LLM_MODEL", "deepseek-reasoner")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.deepseek.com")
+# Required, there is no default key
+LLM_API_KEY = os.getenv("LLM_API_KEY")
+
+LLM_CONCURRENCY = 8
+LLM_REQUESTS_PER_MINUTE = 120
+LLM_RETRIES = 3
+RETRY_BACKOFF = 2.0
+ENRICH_QUEUE_SIZE = 10000
+
+# Budget of the crawled text put in a prompt
+LLM_INPUT_TOKENS = 250
+CHARS_PER_TOKEN = 4
+
+# Batch mode packs companies into one request until their estimated input
+# tokens reach the budget, waiting at most BATCH_WAIT seconds to fill it
+BATCH_TOKEN_BUDGET = 4000
+MAX_BATCH_SIZE = 20
+BATCH_WAIT = 0.5
+# Tokens for the RIC, URL and separators around each company's text
+ITEM_OVERHEAD_TOKENS = 40
+
+RESULT_FIELDS = ("purpose", "paragraph", "confidence", "overview", "focus", "inference")
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidLLMResult(ValueError):
+    """The model answered something that is not the expected JSON"""
+
+
+def _failure(error: Exception) -> str:
+    return "invalid" if isinstance(error, InvalidLLMResult) else "error"
+
+
+@dataclass
+class EnrichmentJob:
+    ric: str
+    url: str
+    text: str
+
+
+@lru_cache(maxsize=None)
+def load_prompt_template(file_path: str = PROMPT_PATH) -> str:
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def create_client() -> AsyncOpenAI:
+    if not LLM_API_KEY:
+        raise RuntimeError(
+            "LLM_API_KEY is not set, export the API key of the LLM provider at "
+            f"{LLM_BASE_URL}"
+        )
+    # Retries are handled by the Enricher, with its own backoff
+    return AsyncOpenAI(api_key=LLM_API_KEY, base_url=LLM_BASE_URL, max_retries=0)
+
+
+def _load_json(content: str | None, opening: str, closing: str):
+    if not content:
+        raise InvalidLLMResult("Empty answer")
+
+    start, end = content.find(opening), content.rfind(closing)
+    if start < 0 or end < start:
+        raise InvalidLLMResult("No JSON in the answer")
+
+    try:
+        return json.loads(content[start : end + 1])
+    except json.JSONDecodeError as e:
+        raise InvalidLLMResult(f"Malformed JSON: {e}") from e
+
+
+def validate_result(data) -> dict:
+    """Check the fields of one company's result and normalize their types"""
+    if not isinstance(data, dict):
+        raise InvalidLLMResult(f"Expected an object, got {type(data).__name__}")
+
+    missing = [field for field in RESULT_FIELDS if field not in data]
+    if missing:
+        raise InvalidLLMResult(f"Missing fields: {', '.join(missing)}")
+
+    result = {}
+    for field in RESULT_FIELDS:
+        value = data[field]
+        if isinstance(value, list):
+            value = ", ".join(str(item) for item in value)
+        result[field] = value
+
+    try:
+        result["confidence"] = int(result["confidence"])
+    except (TypeError, ValueError) as e:
+        raise InvalidLLMResult(f"Invalid confidence: {result['confidence']}") from e
+
+    return result
+
+
+def parse_llm_result(content: str | None) -> dict:
+    """Extract and validate the JSON object of a model answer"""
+    return validate_result(_load_json(content, "{", "}"))
+
+
+def parse_batch_result(content: str | None) -> dict[str, dict]:
+    """
+    Extract the results of a batch answer by RIC. Items that fail validation
+    are left out, the caller retries them one by one.
+    """
+    items = _load_json(content, "[", "]")
+    if not isinstance(items, list):
+        raise InvalidLLMResult("Expected a JSON array")
+
+    results = {}
+    for item in items:
+        try:
+            results[str(item["ric"])] = validate_result(item)
+        except (InvalidLLMResult, KeyError, TypeError):
+            continue
+    return results
+
+
+def estimate_tokens(job: EnrichmentJob) -> int:
+    return len(prepare_input(job.text)) // CHARS_PER_TOKEN + ITEM_OVERHEAD_TOKENS
+
+
+def prepare_input(text: str) -> str:
+    """The passages of the crawled text that are sent to the model"""
+    return select_passages(text, LLM_INPUT_TOKENS * CHARS_PER_TOKEN)
+
+
+async def send_to_llm_async(client: AsyncOpenAI, url: str, text: str) -> str | None:
+    prompt = load_prompt_template().format(url=url, text=prepare_input(text))
+
+    response = await client.chat.completions.create(
+        model=LLM_MODEL,
+        temperature=1.0,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        stream=False,
+    )
+    return response.choices[0].message.content
+
+
+async def send_batch_to_llm_async(
+    client: AsyncOpenAI, jobs: list[EnrichmentJob]
+) -> str | None:
+    companies = "\n\n".join(
+        f'RIC: {job.ric}\nCompany URL: {job.url}\nWebsite Text:\n"""\n'
+        f'{prepare_input(job.text)}\n"""'
+        for job in jobs
+    )
+    prompt = load_prompt_template(BATCH_PROMPT_PATH).format(companies=companies)
+
+    response = await client.chat.completions.create(
+        model=LLM_MODEL,
+        temperature=1.0,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        stream=False,
+    )
+    return response.choices[0].message.content
+
+
+def send_to_llm(url: str, text: str) -> str | None:
+    async def run():
+        async with create_client() as client:
+            return await send_to_llm_async(client, url, text)
+
+    try:
+        return asyncio.run(run())
+    except Exception as e:
+        logger.error("Error sending to LLM: %s", e)
+        return None
+
+
+class Enricher:
+    """
+    LLM stage of the pipeline. Crawled text is queued with submit() and a
+    pool of workers sends it to the model, at most `concurrency` requests
+    at once and `requests_per_minute` overall. Failed calls and invalid
+    answers are retried with exponential backoff, valid results are saved
+    with update_purpose. With a cache, a text already sent with the same
+    prompt and model is answered without calling the model.
+
+    With `batch_tokens`, each worker packs the queued companies into one
+    request up to that input budget and asks for a JSON array keyed by RIC.
+    Companies missing from the answer or failing validation are retried
+    with single-company requests.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = LLM_CONCURRENCY,
+        requests_per_minute: float | None = LLM_REQUESTS_PER_MINUTE,
+        retries: int = LLM_RETRIES,
+        client: AsyncOpenAI | None = None,
+        cache: LLMCache | None = None,
+        batch_tokens: int | None = None,
+    ) -> None:
+        self.concurrency = concurrency
+        self.retries = retries
+        self.batch_tokens = batch_tokens
+        self.client = client or create_client()
+        self.cache = cache
+        self.enriched = 0
+        self.failed = 0
+        self.retried = 0
+        self.requests = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=ENRICH_QUEUE_SIZE)
+        self._bucket = (
+            TokenBucket(60 / requests_per_minute) if requests_per_minute else None
+        )
+        self._workers: list[asyncio.Task] = []
+
+    async def __aenter__(self) -> "Enricher":
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def submit(self, ric: str, url: str, text: str) -> None:
+        await self._queue.put(EnrichmentJob(ric, url, text))
+
+    async def close(self) -> None:
+        """Wait for the queued jobs, then stop the workers"""
+        await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.client.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def stats(self) -> dict:
+        stats = {
+            "enriched": self.enriched,
+            "failed": self.failed,
+            "retried": self.retried,
+            "requests": self.requests,
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    @staticmethod
+    def _cache_template() -> str:
+        # A cached result may come from a single or a batch request, so
+        # editing either prompt makes it stale
+        return load_prompt_template() + load_prompt_template(BATCH_PROMPT_PATH)
+
+    def _cache_key(self, url: str, text: str) -> str:
+        # Companies listed under several spellings of one link share results
+        site = link_key(url) or url
+        return cache_key(self._cache_template(), LLM_MODEL, prepare_input(text), site)
+
+    def _cached(self, url: str, text: str) -> dict | None:
+        if self.cache is None:
+            return None
+        return self.cache.get(self._cache_key(url, text))
+
+    def _remember(self, url: str, text: str, result: dict) -> None:
+        if self.cache is not None:
+            key = self._cache_key(url, text)
+            self.cache.put(key, self._cache_template(), LLM_MODEL, result)
+
+    async def _wait_for_rate_limit(self) -> None:
+        self.requests += 1
+        if self._bucket is not None:
+            await asyncio.sleep(self._bucket.reserve())
+
+    async def enrich(self, url: str, text: str) -> dict | None:
+        """Ask the model for the purpose in `text`, None if every attempt failed"""
+        result = self._cached(url, text)
+        if result is not None:
+            return result
+
+        for attempt in range(self.retries + 1):
+            await self._wait_for_rate_limit()
+
+            try:
+                with metrics.span("llm", kind="single"):
+                    content = await send_to_llm_async(self.client, url, text)
+                result = parse_llm_result(content)
+                metrics.LLM_REQUESTS.inc(kind="single", result="ok")
+                self._remember(url, text, result)
+                return result
+            except Exception as e:
+                metrics.LLM_REQUESTS.inc(kind="single", result=_failure(e))
+                if attempt == self.retries:
+                    logger.error("Error sending %s to LLM: %s", url, e)
+                    return None
+
+                self.retried += 1
+                delay = RETRY_BACKOFF * 2**attempt
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        return None
+
+    async def enrich_batch(self, jobs: list[EnrichmentJob]) -> dict[str, dict]:
+        """Results of one batch request by RIC, empty if the request failed"""
+        await self._wait_for_rate_limit()
+        try:
+            with metrics.span("llm", kind="batch", size=len(jobs)):
+                content = await send_batch_to_llm_async(self.client, jobs)
+            results = parse_batch_result(content)
+            metrics.LLM_REQUESTS.inc(kind="batch", result="ok")
+        except Exception as e:
+            metrics.LLM_REQUESTS.inc(kind="batch", result=_failure(e))
+            logger.error(
+                "Error sending a batch of %d companies to LLM: %s", len(jobs), e
+            )
+            return {}
+
+        for job in jobs:
+            if job.ric in results:
+                self._remember(job.url, job.text, results[job.ric])
+        return results
+
+    async def _next_batch(self) -> list[EnrichmentJob]:
+        """The next job, plus as many queued ones as fit in the token budget"""
+        jobs = [await self._queue.get()]
+        if not self.batch_tokens:
+            return jobs
+
+        budget = self.batch_tokens - estimate_tokens(jobs[0])
+        deadline = asyncio.get_running_loop().time() + BATCH_WAIT
+        while len(jobs) < MAX_BATCH_SIZE:
+            try:
+                job = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    job = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            cost = estimate_tokens(job)
+            if cost > budget:
+                # Leave it for the next batch
+                self._queue.put_nowait(job)
+                self._queue.task_done()
+                break
+            budget -= cost
+            jobs.append(job)
+        return jobs
+
+    async def _process(self, jobs: list[EnrichmentJob]) -> None:
+        pending = []
+        for job in jobs:
+            result = self._cached(job.url, job.text)
+            if result is None:
+                pending.append(job)
+            else:
+                self._save(job, result)
+
+        batch_results = {}
+        if len(pending) > 1:
+            batch_results = await self.enrich_batch(pending)
+
+        for job in pending:
+            result = batch_results.get(job.ric)
+            if result is None:
+                result = await self.enrich(job.url, job.text)
+            self._save(job, result)
+
+    def _save(self, job: EnrichmentJob, result: dict | None) -> None:
+        if result is None:
+            self.failed += 1
+            return
+        update_purpose(job.url, **result)
+        self.enriched += 1
+
+    async def _worker(self) -> None:
+        while True:
+            jobs = await self._next_batch()
+            try:
+                await self._process(jobs)
+            except Exception as e:
+                self.failed += 1
+                logger.error(
+                    "Error enriching %s: %s", ", ".join(job.url for job in jobs), e
+                )
+            finally:
+                for _ in jobs:
+                    self._queue.task_done()
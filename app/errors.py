@@ -0,0 +1,125 @@
+import contextvars
+import socket
+import ssl
+from contextlib import contextmanager
+
+from discovery import DisallowedByRobots
+from fetcher import UnwantedContent
+
+# Why a crawl failed, stored with the company to decide when to retry it,
+# see RETRY_POLICY in db
+DNS = "DNS"
+CONNECT = "CONNECT"
+TIMEOUT = "TIMEOUT"
+HTTP_4XX = "HTTP_4XX"
+HTTP_5XX = "HTTP_5XX"
+PARSE = "PARSE"
+OTHER = "OTHER"
+
+# Client errors that say "later" rather than "never"
+TRANSIENT_STATUSES = (408, 425, 429)
+
+
+def _chain(error: BaseException):
+    """The error and the errors behind it, as wrapped by requests and aiohttp"""
+    seen = set()
+    pending = [error]
+    while pending:
+        error = pending.pop(0)
+        if error is None or id(error) in seen:
+            continue
+        seen.add(id(error))
+        yield error
+        pending.extend(
+            [
+                error.__cause__,
+                error.__context__,
+                # urllib3's MaxRetryError and aiohttp's ClientConnectorError
+                getattr(error, "reason", None),
+                getattr(error, "os_error", None),
+            ]
+        )
+        pending.extend(arg for arg in error.args if isinstance(arg, BaseException))
+
+
+def _status(error: BaseException) -> int | None:
+    # aiohttp's ClientResponseError, or requests' HTTPError
+    status = getattr(error, "status", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _name(error: BaseException) -> str:
+    return type(error).__name__
+
+
+def classify_error(error: BaseException) -> str:
+    """The class of a crawl failure, from requests, aiohttp or the crawler"""
+    errors = list(_chain(error))
+
+    for e in errors:
+        status = _status(e)
+        if status is not None and status >= 400:
+            if status >= 500 or status in TRANSIENT_STATUSES:
+                return HTTP_5XX
+            return HTTP_4XX
+    if any(isinstance(e, DisallowedByRobots) for e in errors):
+        # The site does not want us, like a 403
+        return HTTP_4XX
+    if any(
+        isinstance(e, socket.gaierror)
+        or "DNS" in _name(e)
+        or "NameResolution" in _name(e)
+        for e in errors
+    ):
+        return DNS
+    if any(isinstance(e, TimeoutError) or "Timeout" in _name(e) for e in errors):
+        return TIMEOUT
+    if any(
+        isinstance(e, (ConnectionError, ssl.SSLError))
+        or "Connect" in _name(e)
+        or "SSL" in _name(e)
+        for e in errors
+    ):
+        return CONNECT
+    if any(isinstance(e, (UnwantedContent, UnicodeError)) for e in errors):
+        return PARSE
+    return OTHER
+
+
+class SiteErrors:
+    """The first failure met while crawling one site"""
+
+    def __init__(self) -> None:
+        self.error_class: str | None = None
+        self.error: BaseException | None = None
+
+    def record(self, error: BaseException) -> None:
+        if self.error is None:
+            self.error = error
+            self.error_class = classify_error(error)
+
+
+_site_errors: contextvars.ContextVar[SiteErrors | None] = contextvars.ContextVar(
+    "site_errors", default=None
+)
+
+
+@contextmanager
+def capture():
+    """Collect the failures recorded while crawling one site"""
+    errors = SiteErrors()
+    token = _site_errors.set(errors)
+    try:
+        yield errors
+    finally:
+        _site_errors.reset(token)
+
+
+def record(error: BaseException) -> None:
+    """Note a failure that decides the outcome of the site being crawled"""
+    errors = _site_errors.get()
+    if errors is not None:
+        errors.record(error)
@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Callable
+
+from matcher import MATCHER, normalize_text
+
+# Tags whose content is never visible text
+SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+
+# Tags that separate blocks of text, which end up on their own line
+BLOCK_TAGS = set(
+    """
+    address article aside blockquote br dd div dl dt footer form h1 h2 h3 h4 h5
+    h6 header hr li main nav ol p section table td th tr ul
+    """.split()
+)
+
+# Characters of text still collected once a phrase matched, so that the
+# sentence it introduces is not cut off
+TEXT_AFTER_MATCH = 2000
+
+# Raw text kept between pieces to match keywords across them
+TAIL_LENGTH = 64
+
+
+@dataclass
+class ParsedPage:
+    """What the crawlers keep of a page: its links with their anchor text, and its text"""
+
+    links: list[tuple[str, str]]
+    text: str
+
+
+class PageScanner(HTMLParser):
+    """
+    Event-driven scanner fed with the page as it is downloaded.
+    It collects the links and the visible text, and reports `done` as soon as
+    a link accepted by `link_filter` is seen or some text after a keyword of
+    `keyword_set` has been read, so the caller can stop downloading.
+    """
+
+    def __init__(
+        self,
+        link_filter: Callable[[str], bool] | None = None,
+        keyword_set: str | None = None,
+        text_after_match: int = TEXT_AFTER_MATCH,
+    ) -> None:
+        super().__init__(convert_charrefs=True)
+        self.links: list[str] = []
+        self.anchor_texts: list[str] = []
+        self.found_link: str | None = None
+        self.found_phrase: str | None = None
+        self._link_filter = link_filter
+        self._keyword_set = keyword_set
+        self._text_after_match = text_after_match
+        self._texts: list[str] = []
+        self._length = 0
+        self._match_end: int | None = None
+        self._tail = ""
+        self._skip_depth = 0
+        self._anchor: list[str] | None = None
+
+    @property
+    def done(self) -> bool:
+        if self.found_link is not None:
+            return True
+        return (
+            self._match_end is not None
+            and self._length - self._match_end >= self._text_after_match
+        )
+
+    @property
+    def text(self) -> str:
+        return "".join(self._texts)
+
+    def page(self) -> ParsedPage:
+        return ParsedPage(list(zip(self.links, self.anchor_texts)), self.text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+            return
+
+        if tag in BLOCK_TAGS:
+            self.handle_data("\n")
+
+        if tag != "a" or self.found_link is not None:
+            return
+
+        href = dict(attrs).get("href")
+        if href is None:
+            return
+
+        self._close_anchor()
+        self._anchor = []
+        self.links.append(href)
+        if self._link_filter is not None and self._link_filter(href):
+            self.found_link = href
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in BLOCK_TAGS:
+            self.handle_data("\n")
+        elif tag == "a":
+            self._close_anchor()
+
+    def close(self):
+        super().close()
+        self._close_anchor()
+
+    def _close_anchor(self) -> None:
+        if self._anchor is not None:
+            self.anchor_texts.append(" ".join("".join(self._anchor).split()))
+            self._anchor = None
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+
+        if self._anchor is not None:
+            self._anchor.append(data)
+
+        self._texts.append(data)
+        self._length += len(data)
+
+        if self._keyword_set is not None and self.found_phrase is None:
+            # Text arrives in arbitrary pieces, keep enough of the previous
+            # ones to catch a keyword split between them
+            tail = self._tail + data
+            match = MATCHER.first(normalize_text(tail), self._keyword_set)
+            if match is not None:
+                self.found_phrase = match.keyword
+                self._match_end = self._length
+            self._tail = tail[-TAIL_LENGTH:]
+
+
+def parse_page(html: str) -> ParsedPage:
+    """Links and visible text of a whole page in a single pass"""
+    scanner = PageScanner()
+    scanner.feed(html)
+    scanner.close()
+    return scanner.page()
+
+
+def extract_links(html: str) -> list[tuple[str, str]]:
+    """(href, anchor text) of every <a href> of the page"""
+    return parse_page(html).links
+
+
+def extract_text(html: str) -> str:
+    """Visible text of the page, without script and style content"""
+    return parse_page(html).text
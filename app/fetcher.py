@@ -0,0 +1,351 @@
+import asyncio
+import codecs
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import aiohttp
+import deadline
+import metrics
+from discovery import ROBOTS
+from extract import PageScanner
+from httpcache import HttpCache
+from parsepool import ParsePool, ParseResult, scan_result
+from politeness import HostScheduler
+
+MAX_CONCURRENCY = 200
+REQUEST_TIMEOUT = 15
+
+# Streaming reads stop after this many bytes of a page
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+CHUNK_SIZE = 16 * 1024
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+
+class UnwantedContent(Exception):
+    """The response is not a page the crawler can read"""
+
+
+@dataclass
+class Response:
+    url: str
+    status: int
+    headers: dict
+    body: bytes
+    encoding: str = "utf-8"
+    from_cache: bool = False
+    truncated: bool = False
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.encoding, errors="replace")
+
+
+def check_content_type(
+    content_type: str | None, accepted: tuple[str, ...] = HTML_CONTENT_TYPES
+) -> None:
+    """Raise UnwantedContent unless the response looks like HTML, or `accepted`"""
+    if not content_type:
+        return
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type not in accepted:
+        raise UnwantedContent(f"Skipping {media_type} content")
+
+
+class StreamReader:
+    """
+    Decode response chunks and feed them to a scanner until it is done or
+    the byte budget is spent. Used by both the async and the sync crawler.
+    Without a scanner the body is only collected, up to the budget. A
+    scanner with a true `binary` attribute is fed the raw bytes, and its
+    `content_types` replace the HTML types the readers accept.
+    """
+
+    def __init__(self, scanner, encoding: str | None, max_bytes: int) -> None:
+        self.scanner = scanner
+        self.binary = getattr(scanner, "binary", False)
+        self.content_types = getattr(scanner, "content_types", HTML_CONTENT_TYPES)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.complete = False
+        # Time spent in the scanner, observed as the parse stage
+        self.parse_seconds = 0.0
+        self._chunks: list[bytes] = []
+        try:
+            self.encoding = codecs.lookup(encoding or "utf-8").name
+        except LookupError:
+            self.encoding = "utf-8"
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self._chunks)
+
+    def feed(self, chunk: bytes) -> bool:
+        """Feed one chunk, return True once reading should stop"""
+        chunk = chunk[: self.max_bytes - self.size]
+        self._chunks.append(chunk)
+        self.size += len(chunk)
+        if self.scanner is None:
+            return self.size >= self.max_bytes
+        start = time.perf_counter()
+        self.scanner.feed(chunk if self.binary else self._decoder.decode(chunk))
+        self.parse_seconds += time.perf_counter() - start
+        return self.scanner.done or self.size >= self.max_bytes
+
+    def finish(self) -> None:
+        """Signal the end of the body"""
+        self.complete = True
+        if self.scanner is None:
+            return
+        start = time.perf_counter()
+        if not self.binary:
+            self.scanner.feed(self._decoder.decode(b"", final=True))
+        self.scanner.close()
+        self.parse_seconds += time.perf_counter() - start
+
+    def observe(self) -> None:
+        """Record the time spent scanning this page"""
+        if self.scanner is not None:
+            metrics.observe("parse", self.parse_seconds)
+
+
+class Fetcher:
+    """
+    Asynchronous HTTP client shared by every site of a crawl.
+    A single pooled session is used and at most `concurrency` requests
+    are in flight at any moment, whatever the number of running tasks.
+    Requests to the same host are additionally paced by the scheduler, and
+    pages already in the HTTP cache are revalidated instead of downloaded.
+    With a parse pool, parse() hands the pages to worker processes.
+    Inside deadline.site_deadline(), the timeouts of every request are cut
+    to the time left to the site. Downloaded pages are written to the
+    archive if there is one (see pagearchive.py); in replay mode they are read
+    from it and nothing is downloaded.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = MAX_CONCURRENCY,
+        timeout: float = REQUEST_TIMEOUT,
+        scheduler: HostScheduler | None = None,
+        http_cache: HttpCache | None = None,
+        parse_pool: ParsePool | None = None,
+        archive=None,
+        replay: bool = False,
+    ) -> None:
+        self.concurrency = concurrency
+        self.scheduler = scheduler or HostScheduler()
+        self.http_cache = http_cache
+        self.parse_pool = parse_pool
+        self.archive = archive
+        self.replay = replay
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self) -> "Fetcher":
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _request_timeout(self, url: str) -> aiohttp.ClientTimeout:
+        connect, read = deadline.timeouts(url)
+        total, left = self.timeout.total, deadline.remaining()
+        if left is not None:
+            total = min(total, left) if total else left
+        return aiohttp.ClientTimeout(total=total, connect=connect, sock_read=read)
+
+    @contextmanager
+    def _timeouts(self, url: str):
+        """Count the timeouts of the host, unless the site's budget ran out"""
+        try:
+            yield
+        except asyncio.TimeoutError as e:
+            if deadline.expired():
+                raise deadline.DeadlineExceeded(url) from e
+            self.scheduler.record_timeout(url)
+            raise
+
+    def _archive(self, url: str, response: Response) -> Response:
+        if self.archive is not None:
+            self.archive.write(url, response)
+        return response
+
+    async def get(self, url: str, user_agent: str) -> Response:
+        """GET the url and return the whole body, raising on HTTP errors"""
+        if self.replay:
+            return self.archive.scan(url, None, MAX_PAGE_BYTES)
+        ROBOTS.check(url, user_agent)
+        deadline.check(url)
+        entry = self.http_cache.lookup(url) if self.http_cache else None
+        headers = {"User-Agent": user_agent, **HttpCache.conditional_headers(entry)}
+
+        # Wait for the host before taking a global slot, so sleeping on a
+        # busy host never holds back requests to the others
+        async with self.scheduler.slot(url), self._semaphore:
+            with metrics.span("fetch", url=url), self._timeouts(url):
+                async with self._session.get(
+                    url, headers=headers, timeout=self._request_timeout(url)
+                ) as response:
+                    self.scheduler.record(
+                        url, response.status, response.headers.get("Retry-After")
+                    )
+                    metrics.HTTP_RESPONSES.inc(status=response.status)
+
+                    if response.status == 304 and entry is not None:
+                        self.http_cache.revalidated(entry)
+                        return self._archive(
+                            url,
+                            Response(
+                                url=str(response.url),
+                                status=200,
+                                headers=dict(response.headers),
+                                body=entry.body,
+                                encoding=entry.encoding,
+                                from_cache=True,
+                            ),
+                        )
+
+                    response.raise_for_status()
+                    body = await response.read()
+                    encoding = response.get_encoding()
+
+                    if self.http_cache:
+                        self.http_cache.store(url, response.headers, body, encoding)
+
+                    return self._archive(
+                        url,
+                        Response(
+                            url=str(response.url),
+                            status=response.status,
+                            headers=dict(response.headers),
+                            body=body,
+                            encoding=encoding,
+                        ),
+                    )
+
+    async def scan(
+        self, url: str, user_agent: str, scanner, max_bytes: int = MAX_PAGE_BYTES
+    ) -> Response:
+        """
+        Stream the page into `scanner` and stop downloading as soon as the
+        scanner is done or max_bytes were read. Non-HTML responses raise
+        UnwantedContent before their body is downloaded. With no scanner the
+        body is only read, up to max_bytes. Pages disallowed by the host's
+        robots.txt, once read, raise DisallowedByRobots, and requests made
+        once the site's deadline passed raise DeadlineExceeded.
+        """
+        if self.replay:
+            return self.archive.scan(url, scanner, max_bytes)
+        ROBOTS.check(url, user_agent)
+        deadline.check(url)
+        entry = self.http_cache.lookup(url) if self.http_cache else None
+        headers = {"User-Agent": user_agent, **HttpCache.conditional_headers(entry)}
+
+        async with self.scheduler.slot(url), self._semaphore:
+            with metrics.span("fetch", url=url), self._timeouts(url):
+                return await self._scan(url, headers, entry, scanner, max_bytes)
+
+    async def _scan(
+        self, url: str, headers: dict, entry, scanner, max_bytes: int
+    ) -> Response:
+        async with self._session.get(
+            url, headers=headers, timeout=self._request_timeout(url)
+        ) as response:
+            self.scheduler.record(
+                url, response.status, response.headers.get("Retry-After")
+            )
+            metrics.HTTP_RESPONSES.inc(status=response.status)
+
+            if response.status == 304 and entry is not None:
+                self.http_cache.revalidated(entry)
+                reader = StreamReader(scanner, entry.encoding, max_bytes)
+                if not reader.feed(entry.body):
+                    reader.finish()
+                reader.observe()
+                return self._archive(
+                    url,
+                    Response(
+                        url=str(response.url),
+                        status=200,
+                        headers=dict(response.headers),
+                        body=entry.body,
+                        encoding=entry.encoding,
+                        from_cache=True,
+                    ),
+                )
+
+            response.raise_for_status()
+            reader = StreamReader(scanner, response.charset, max_bytes)
+            check_content_type(
+                response.headers.get("Content-Type"), reader.content_types
+            )
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                if reader.feed(chunk):
+                    break
+            else:
+                reader.finish()
+            reader.observe()
+
+            # A partial body must not be served later as the whole page
+            if reader.complete and self.http_cache:
+                self.http_cache.store(
+                    url, response.headers, reader.body, reader.encoding
+                )
+
+            return self._archive(
+                url,
+                Response(
+                    url=str(response.url),
+                    status=response.status,
+                    headers=dict(response.headers),
+                    body=reader.body,
+                    encoding=reader.encoding,
+                    truncated=not reader.complete,
+                ),
+            )
+
+    async def parse(
+        self,
+        url: str,
+        user_agent: str,
+        keyword_set: str | None = None,
+        max_bytes: int = MAX_PAGE_BYTES,
+    ) -> ParseResult:
+        """
+        Links and cleaned text of the page. Without a parse pool the page is
+        scanned as it downloads and the download stops early once the
+        scanner is done; with one, up to max_bytes are downloaded and parsed
+        in a worker process.
+        """
+        if self.parse_pool is None:
+            scanner = PageScanner(keyword_set=keyword_set)
+            await self.scan(url, user_agent, scanner, max_bytes)
+            return scan_result(scanner)
+
+        response = await self.scan(url, user_agent, None, max_bytes)
+        return await self.parse_pool.parse(
+            response.body, response.encoding, keyword_set
+        )
+
+
+def run_with_fetcher(coro_fn, *args, archive=None, replay: bool = False, **kwargs):
+    """
+    Run `coro_fn(fetcher, *args)` to completion from synchronous code, with
+    a Fetcher using the given archive
+    """
+
+    async def runner():
+        async with Fetcher(archive=archive, replay=replay) as fetcher:
+            return await coro_fn(fetcher, *args, **kwargs)
+
+    return asyncio.run(runner())
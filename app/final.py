@@ -1,12 +1,33 @@
-import json
+import argparse
+import asyncio
+import logging
 import random
-import re
 from urllib.parse import urljoin, urlparse
 
-import requests
-from bs4 import BeautifulSoup
-from db import get_data_status, get_link_from_db, save_to_db, update_purpose
-from openai import OpenAI
+import deadline
+import errors
+import metrics
+import pagearchive
+from db import (
+    HEARTBEAT_INTERVAL,
+    claim_batches,
+    close_db,
+    default_worker_id,
+    heartbeat,
+    iter_unenriched,
+    release_claims,
+    save_to_db,
+)
+from discovery import discover_async
+from enrich import BATCH_TOKEN_BUDGET, LLM_CONCURRENCY, Enricher
+from fetcher import MAX_CONCURRENCY, Fetcher, run_with_fetcher
+from httpcache import HttpCache
+from llmcache import LLMCache
+from matcher import MATCHER, is_about_url
+from pagearchive import PageArchive
+from parsepool import PARSE_WORKERS, ParsePool
+from passages import PAGE_SEPARATOR
+from urls import canonical_url, is_valid_url
 
 USER_AGENTS: list[str] = [
     # Windows 11 User-Agents
@@ -24,72 +45,74 @@ USER_AGENTS: list[str] = [
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Vivaldi/7.0.3495.29 Safari/537.36",  # Vivaldi on Linux
 ]
 
+logger = logging.getLogger(__name__)
 
-def load_by_batch_in_memory(batch_size: int = 10):
-    data = get_link_from_db()
-    for i in range(0, len(data), batch_size):
-        yield data[i : i + batch_size]
+# About page candidates read at once, 1 to read them one after the other,
+# and the limits of what is read when none has a purpose statement
+SPECULATIVE_FETCHES = 3
+MAX_CANDIDATES = 6
+MAX_CANDIDATE_CHARS = 200_000
 
 
-def check_if_scraped(url: str) -> bool:
-    return get_data_status(url) == "SCRAPED"
+def load_by_batch_in_memory(
+    batch_size: int = 10, worker_id: str | None = None, all_companies: bool = False
+):
+    """
+    Yield batches of (ric, web_link) claimed for this worker, so several
+    crawler processes can share the database without doing the same work.
+    """
+    yield from claim_batches(batch_size, worker_id, all_companies)
 
 
-def get_all_urls(url: str, user_agent: str) -> list:
+async def get_all_urls_async(fetcher: Fetcher, url: str, user_agent: str) -> list:
     """Fetch all links from the given URL and return them as a list"""
     try:
-        response = requests.get(url, headers={"User-Agent": user_agent})
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "lxml")
-        return [link["href"] for link in soup.find_all("a") if "href" in link.attrs]
+        page = await fetcher.parse(url, user_agent)
+        return [href for href, _ in page.links]
     except Exception as e:
-        print(f"Error fetching links from {url}: {e}")
+        logger.error("Error fetching links from %s: %s", url, e)
+        errors.record(e)
         return []
 
 
-def is_about_url(url):
-    """Check if URL path contains about-related keywords"""
-    path = urlparse(url).path.lower()
-
-    # TODO: Sort by language and add more keywords
-    keywords = [
-        "about",
-        "who-we-are",
-        "acerca",
-        "information",
-        "sobre",
-        "our",
-        "informacion",
-        "who",
-        "quienes",
-    ]
-    return any(kw in path for kw in keywords)
+def get_all_urls(
+    url: str, user_agent: str, archive: PageArchive | None = None, replay: bool = False
+) -> list:
+    return run_with_fetcher(
+        get_all_urls_async, url, user_agent, archive=archive, replay=replay
+    )
 
 
 def find_about_page(links: list[str]) -> list[str]:
     """Find links containing about-like pages using is_about_url"""
     about_links = set()
     for link in links:
-        if is_about_url(link):
+        if is_valid_url(link) and is_about_url(link):
             about_links.add(link)
     return list(about_links)
 
 
 def prioritize_about_pages(url: str, about_links: list[str]) -> list[str]:
     """Convert to full URLs, group by base path, and select the best URL from each group"""
-    # Convert to full URLs and group by base path
+    # Convert to full URLs and group by base path, whatever its spelling
+    # (http or https, www. or not, trailing slash)
     full_urls = [urljoin(url, link) for link in about_links]
     groups = {}
     for u in full_urls:
         parsed = urlparse(u)
-        base_url = parsed._replace(fragment="", query="").geturl()
+        base_url = canonical_url(parsed._replace(fragment="", query="").geturl())
         groups.setdefault(base_url, []).append(u)
 
-    # Select best URL from each group (prioritize no fragment/query)
+    # Select best URL from each group (prioritize no fragment/query, then https)
     selected_urls = []
     for base_url, urls in groups.items():
         urls_sorted = sorted(
-            urls, key=lambda x: (bool(urlparse(x).fragment or urlparse(x).query), x)
+            urls,
+            key=lambda x: (
+                bool(urlparse(x).fragment or urlparse(x).query),
+                urlparse(x).scheme != "https",
+                x,
+            ),
         )
         selected_urls.append(urls_sorted[0])
 
@@ -106,151 +129,469 @@ def prioritize_about_pages(url: str, about_links: list[str]) -> list[str]:
     return selected_urls
 
 
-def process_text(text: str) -> str:
-    """Preprocess text for better chatbot input"""
-    # Remove extra whitespaces, remove weird characters, remove newlines and tabs (we are going to send the text to chatgpt)
-    text = re.sub(r"\s+", " ", text)
-    text = re.sub(r"[^\x00-\x7F]+", " ", text)
-    text = text.replace("\n", " ").replace("\t", " ")
-    text = text.lower()
-    return text.strip()
-
-
-def get_text_from_url(urls: list[str]) -> str | tuple[str, str]:
-    texts = []
-    for u in urls:
-        response = requests.get(u, headers={"User-Agent": random.choice(USER_AGENTS)})
-        soup = BeautifulSoup(response.text, "html.parser")
-        text = soup.get_text().strip()
-        text = process_text(text)
-
-        # Check if the text contains a purpose statement
-        phrases = [
-            "Our purpose",
-            "Nuestro propósito",
-            "Our purpose is",
-            "Nuestro propósito es",
-        ]
+async def _read_candidate(fetcher: Fetcher, url: str) -> tuple[str, str, bool]:
+    # Parsed text comes back as normalized passages, one per line. Without
+    # a parse pool the download stops shortly after a purpose phrase
+    page = await fetcher.parse(url, random.choice(USER_AGENTS), "purpose")
+
+    # Check if the text contains a purpose statement
+    with metrics.span("match"):
+        found = page.found_phrase or MATCHER.contains(page.text, "purpose")
+    return url, page.text, bool(found)
+
+
+async def read_about_pages(
+    fetcher: Fetcher,
+    urls: list[str],
+    speculative: int = SPECULATIVE_FETCHES,
+    max_candidates: int = MAX_CANDIDATES,
+    max_chars: int = MAX_CANDIDATE_CHARS,
+) -> tuple[str | None, str, bool]:
+    """
+    (url, text, True) for the first candidate page found with a purpose
+    statement, or else (url of the best ranked page read, text of the
+    pages read, False). Up to `speculative` candidates are read at once,
+    in their ranking order, and the others are cancelled as soon as one
+    has a purpose statement. Without one, at most `max_candidates` pages
+    and about `max_chars` of text are read. A candidate that fails is
+    skipped, the error is raised only if none of them could be read. The
+    requests still go through the host scheduler, so the pages of one site
+    are not all requested at the same instant.
+    """
+    # The same page may be listed under several spellings of its URL
+    unique: dict[str, str] = {}
+    for url in urls:
+        unique.setdefault(canonical_url(url), url)
+    candidates = list(unique.values())[:max_candidates]
+    pending: dict[asyncio.Task, int] = {}
+    texts: dict[int, str] = {}
+    collected = 0
+    error: Exception | None = None
+    next_index = 0
+
+    try:
+        while True:
+            while (
+                len(pending) < max(speculative, 1)
+                and next_index < len(candidates)
+                and collected < max_chars
+            ):
+                task = asyncio.create_task(
+                    _read_candidate(fetcher, candidates[next_index])
+                )
+                pending[task] = next_index
+                next_index += 1
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=pending.get):
+                index = pending.pop(task)
+                try:
+                    url, text, found = task.result()
+                except Exception as e:
+                    logger.debug("Error reading candidate page: %s", e)
+                    error = error or e
+                    continue
+                if found:
+                    return url, text, True
+                if text in texts.values():
+                    # Another URL of the same page, e.g. through a redirect
+                    continue
+                texts[index] = text
+                collected += len(text)
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if not texts and error is not None:
+        raise error
+    read = sorted(texts)
+    # Pages stay apart so their common boilerplate can be told from content
+    text = PAGE_SEPARATOR.join(texts[index] for index in read)
+    return (candidates[read[0]] if read else None), text, False
+
+
+async def get_text_from_url_async(
+    fetcher: Fetcher,
+    urls: list[str],
+    speculative: int = SPECULATIVE_FETCHES,
+    max_candidates: int = MAX_CANDIDATES,
+    max_chars: int = MAX_CANDIDATE_CHARS,
+) -> str | tuple[str, str]:
+    """
+    (url, text) of the first candidate page found with a purpose statement,
+    or else the text of the pages read, see read_about_pages()
+    """
+    url, text, found = await read_about_pages(
+        fetcher, urls, speculative, max_candidates, max_chars
+    )
+    return (url, text) if found else text
 
-        if any(phrase.lower() in text.lower() for phrase in phrases):
-            return u, text
 
-        texts.append(text)
-    return " ".join(texts)
+def get_text_from_url(
+    urls: list[str], archive: PageArchive | None = None, replay: bool = False
+) -> str | tuple[str, str]:
+    """With `replay`, the pages are read from the archive instead of the network"""
+    return run_with_fetcher(
+        get_text_from_url_async, urls, archive=archive, replay=replay
+    )
 
 
-def scrape(url: str, user_agent: str) -> tuple[str, str] | str | None:
+async def scrape_async(
+    fetcher: Fetcher,
+    url: str,
+    user_agent: str,
+    speculative: int = SPECULATIVE_FETCHES,
+) -> tuple[str, str] | str | None:
     try:
         url = url.rstrip("/")
-        urls = get_all_urls(url, user_agent)
-        about_pages = find_about_page(urls)
 
+        # The sitemap may list the about pages, then the homepage is not parsed
+        # unless none of them can be read or has a purpose statement. Their
+        # errors don't decide the outcome of the site, the homepage does.
+        sitemap_pages = await discover_async(fetcher, url, user_agent)
+        fallback = None
+        if sitemap_pages:
+            try:
+                page, text, found = await read_about_pages(
+                    fetcher, sitemap_pages, speculative
+                )
+            except Exception as e:
+                logger.debug("No about page of %s read from its sitemap: %s", url, e)
+            else:
+                if found:
+                    return page, text
+                if page is not None:
+                    fallback = page, text
+
+        urls = await get_all_urls_async(fetcher, url, user_agent)
+        about_pages = [
+            page
+            for page in prioritize_about_pages(url, find_about_page(urls))
+            if page not in sitemap_pages
+        ]
         if not about_pages:
-            return None
-
-        selected_url = prioritize_about_pages(url, about_pages)
-
-        result = get_text_from_url(selected_url)
-
-        if isinstance(result, tuple):
-            return result
-
-        return about_pages[0], result
+            return fallback
+
+        try:
+            page, text, found = await read_about_pages(
+                fetcher, about_pages, speculative
+            )
+        except Exception:
+            if fallback is None:
+                raise
+            return fallback
+
+        if found or fallback is None:
+            return (page, text) if page is not None else None
+        return fallback
     except Exception as e:
-        print(f"Error scraping {url}: {e}")
+        logger.error("Error scraping %s: %s", url, e)
+        errors.record(e)
         return "ERROR"
 
 
-# Configure the DeepSeek client
-client = OpenAI(
-    api_key="sk-cd938bc8f65e4b62913978d38a87452f",  # Consider using os.getenv for production
-    base_url="https://api.deepseek.com",
-)
-
-
-def load_prompt_template(file_path: str) -> str:
-    with open(file_path, "r", encoding="utf-8") as f:
-        return f.read()
+def scrape(
+    url: str, user_agent: str, archive: PageArchive | None = None, replay: bool = False
+) -> tuple[str, str] | str | None:
+    """With `replay`, the pages are read from the archive instead of the network"""
+    return run_with_fetcher(
+        scrape_async, url, user_agent, archive=archive, replay=replay
+    )
 
 
-def send_to_llm(url: str, text: str) -> str | None:
-    prompt_template = load_prompt_template("prompt.txt")
-    prompt = prompt_template.format(url=url, text=text[:600])
+async def scrape_company(
+    fetcher: Fetcher,
+    enricher: Enricher,
+    ric: str,
+    url: str,
+    site_deadline: float | None = deadline.SITE_DEADLINE,
+    speculative: int = SPECULATIVE_FETCHES,
+) -> None:
+    if not url or url in ["ERROR", "EMPTY", "NULL"]:
+        logger.warning("Invalid URL: %s", url)
+        return
+
+    with (
+        metrics.site(url),
+        errors.capture() as failure,
+        deadline.site_deadline(site_deadline) as budget,
+        pagearchive.company(ric),
+    ):
+        try:
+            # The request timeouts follow the budget, this also bounds the
+            # waits for the host and for a parse worker
+            result = await asyncio.wait_for(
+                scrape_async(fetcher, url, random.choice(USER_AGENTS), speculative),
+                budget.remaining() if budget else None,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Deadline of %s exceeded", url)
+            errors.record(deadline.DeadlineExceeded(url))
+            result = "ERROR"
+
+    if result is None and failure.error is None:
+        save_to_db(url, "", "EMPTY")
+    elif result is None or result == "ERROR":
+        # An unreachable homepage has no links, but it is not an empty site
+        save_to_db(url, "", "ERROR", failure.error_class)
+    else:
+        about_url, text = result
+        save_to_db(url, about_url, "SCRAPED")
+
+        # The model is called by the enrichment workers, the crawl goes on
+        await enricher.submit(ric, url, text)
+
+
+async def _scrape_worker(
+    fetcher: Fetcher,
+    enricher: Enricher,
+    queue: asyncio.Queue,
+    site_deadline: float | None,
+    speculative: int,
+) -> None:
+    while True:
+        ric, url = await queue.get()
+        try:
+            await scrape_company(
+                fetcher, enricher, ric, url, site_deadline, speculative
+            )
+        except Exception as e:
+            logger.error("Error processing %s: %s", url, e)
+        finally:
+            queue.task_done()
+
+
+async def _keep_leases(worker_id: str) -> None:
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        await asyncio.to_thread(heartbeat, worker_id)
+
+
+async def scrape_sites_async(
+    batch_size: int = 10,
+    concurrency: int = MAX_CONCURRENCY,
+    worker_id: str | None = None,
+    llm_concurrency: int = LLM_CONCURRENCY,
+    llm_batch_tokens: int | None = BATCH_TOKEN_BUDGET,
+    parse_workers: int = PARSE_WORKERS,
+    site_deadline: float | None = deadline.SITE_DEADLINE,
+    archive: PageArchive | None = None,
+    replay: bool = False,
+    speculative: int = SPECULATIVE_FETCHES,
+) -> None:
+    """
+    Crawl every company with up to `concurrency` sites in flight.
+    Links are claimed from the database, in a thread, in batches of at
+    least `concurrency` sites and handed to a fixed pool of workers
+    sharing one Fetcher. Pages are parsed by `parse_workers`
+    processes (in the event loop if 0), and crawled text is enriched by the
+    LLM workers in the background. The crawl of a site stops after
+    `site_deadline` seconds. Fetched pages go to the archive if one is
+    given; with `replay` every company is crawled again from it, offline.
+    `speculative` about page candidates of a site are read at once.
+    """
+    worker_id = worker_id or default_worker_id()
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    http_cache = HttpCache()
+    parse_pool = ParsePool(parse_workers) if parse_workers else None
+
+    async with (
+        Fetcher(
+            concurrency,
+            http_cache=http_cache,
+            parse_pool=parse_pool,
+            archive=archive,
+            replay=replay,
+        ) as fetcher,
+        Enricher(
+            llm_concurrency, cache=LLMCache(), batch_tokens=llm_batch_tokens
+        ) as enricher,
+    ):
+        workers = [
+            asyncio.create_task(
+                _scrape_worker(fetcher, enricher, queue, site_deadline, speculative)
+            )
+            for _ in range(concurrency)
+        ]
+        workers.append(asyncio.create_task(_keep_leases(worker_id)))
 
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-reasoner",
-            temperature=1.0,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a cautious assistant extracting company purposes.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            stream=False,
+        # Claims are synchronous transactions, run off the event loop
+        batches = load_by_batch_in_memory(
+            max(batch_size, concurrency), worker_id, replay
         )
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, batches, None)
+                if chunk is None:
+                    break
+                for ric, url in chunk:
+                    await queue.put((ric, url))
+
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            release_claims(worker_id)
+            if parse_pool is not None:
+                parse_pool.close()
+            if archive is not None:
+                archive.close()
+
+    logger.info("HTTP cache: %s", http_cache.stats())
+    logger.info("Enrichment: %s", enricher.stats())
+    if archive is not None:
+        logger.info("Archive: %s", archive.stats())
+    http_cache.close()
+    close_db()
+    logger.info("End")
+
+
+def scrape_sites(
+    batch_size: int = 10,
+    concurrency: int = MAX_CONCURRENCY,
+    worker_id: str | None = None,
+    llm_concurrency: int = LLM_CONCURRENCY,
+    llm_batch_tokens: int | None = BATCH_TOKEN_BUDGET,
+    parse_workers: int = PARSE_WORKERS,
+    site_deadline: float | None = deadline.SITE_DEADLINE,
+    archive: PageArchive | None = None,
+    replay: bool = False,
+    speculative: int = SPECULATIVE_FETCHES,
+) -> None:
+    asyncio.run(
+        scrape_sites_async(
+            batch_size,
+            concurrency,
+            worker_id,
+            llm_concurrency,
+            llm_batch_tokens,
+            parse_workers,
+            site_deadline,
+            archive,
+            replay,
+            speculative,
+        )
+    )
 
-        result = response.choices[0].message.content
-        return result
-    except Exception as e:
-        print(f"Error sending to LLM: {e}")
-        return None
-
-
-def scrape_sites(batch_size: int = 10) -> None:
-    for chunk in load_by_batch_in_memory(batch_size):
-        user_agent = random.choice(USER_AGENTS)
-        for url_tuple in chunk:
-            url = url_tuple[0]
-
-            if check_if_scraped(url):
-                print(f"Already scraped: {url}")
-                continue
-
-            if not url or url in ["ERROR", "EMPTY", "NULL"]:
-                print(f"Invalid URL: {url}")
-                continue
-
-            result = scrape(url, user_agent)
-
-            if result is None:
-                save_to_db(url, "", "EMPTY")
-            elif result == "ERROR":
-                save_to_db(url, "", "ERROR")
-            else:
-                about_url, text = result
-                save_to_db(url, about_url, "SCRAPED")
-
-                deepseek_result = send_to_llm(url, text)
-
-                text = json.loads(
-                    deepseek_result.strip("```json").strip().lstrip("#").strip()
-                )
-
-                # Split it for saving into variables and then into the database
-                purpose = text["purpose"]
-                paragraph = text["paragraph"]
-                confidence = text["confidence"]
-                overview = text["overview"]
-                focus = text["focus"]
-                inference = text["inference"]
-
-                update_purpose(
-                    url,
-                    purpose,
-                    paragraph,
-                    confidence,
-                    overview,
-                    focus,
-                    inference,
-                )
-
-            break
 
-    print("End")
+async def _fetch_and_submit(
+    fetcher: Fetcher, enricher: Enricher, ric: str, url: str, about_url: str
+) -> None:
+    with pagearchive.company(ric):
+        result = await get_text_from_url_async(fetcher, [about_url])
+    text = result[1] if isinstance(result, tuple) else result
+    await enricher.submit(ric, url, text)
+
+
+async def enrich_sites_async(
+    batch_size: int = 100,
+    llm_concurrency: int = LLM_CONCURRENCY,
+    llm_batch_tokens: int | None = BATCH_TOKEN_BUDGET,
+    archive: PageArchive | None = None,
+    replay: bool = False,
+) -> None:
+    """
+    Run only the enrichment stage, over the companies already scraped but
+    without a purpose, reading the text again from their about page, or
+    from the archive with `replay`.
+    """
+    async with (
+        Fetcher(http_cache=HttpCache(), archive=archive, replay=replay) as fetcher,
+        Enricher(
+            llm_concurrency, cache=LLMCache(), batch_tokens=llm_batch_tokens
+        ) as enricher,
+    ):
+        for chunk in iter_unenriched(batch_size):
+            results = await asyncio.gather(
+                *(
+                    _fetch_and_submit(fetcher, enricher, ric, url, about_url)
+                    for ric, url, about_url in chunk
+                ),
+                return_exceptions=True,
+            )
+            for (_, url, _), result in zip(chunk, results):
+                if isinstance(result, Exception):
+                    logger.error("Error reading %s for enrichment: %s", url, result)
+
+    logger.info("Enrichment: %s", enricher.stats())
+    if archive is not None:
+        archive.close()
+    close_db()
 
 
 if __name__ == "__main__":
-    # For not loading all at once (I think it is useless)
-    scrape_sites(1)
+    parser = argparse.ArgumentParser(description="Crawl and enrich the companies.")
+    parser.add_argument(
+        "--enrich-only",
+        action="store_true",
+        help="Only send the already scraped companies to the LLM",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=MAX_CONCURRENCY,
+        help="Sites crawled at once, also the limit of requests in flight",
+    )
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY)
+    parser.add_argument(
+        "--llm-batch-tokens",
+        type=int,
+        default=BATCH_TOKEN_BUDGET,
+        help="Input token budget of a multi-company LLM request, 0 to send one company per request",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=PARSE_WORKERS,
+        help="Processes parsing the pages, 0 to parse them in the crawler process",
+    )
+    parser.add_argument(
+        "--site-deadline",
+        type=float,
+        default=deadline.SITE_DEADLINE,
+        help="Seconds allowed for the crawl of one site, 0 for no limit",
+    )
+    parser.add_argument(
+        "--speculative-fetches",
+        type=int,
+        default=SPECULATIVE_FETCHES,
+        help="About page candidates read at once, 1 to read them one after the other",
+    )
+    parser.add_argument(
+        "--invalidate-llm-cache",
+        action="store_true",
+        help="Drop the cached LLM results, e.g. after editing a prompt",
+    )
+    pagearchive.add_arguments(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.setup(args)
+    archive = pagearchive.from_arguments(args)
+
+    if args.invalidate_llm_cache:
+        logger.info("Dropped %d cached LLM results", LLMCache().purge())
+
+    if args.enrich_only:
+        asyncio.run(
+            enrich_sites_async(
+                llm_concurrency=args.llm_concurrency,
+                llm_batch_tokens=args.llm_batch_tokens,
+                archive=archive,
+                replay=args.replay,
+            )
+        )
+    else:
+        scrape_sites(
+            concurrency=args.concurrency,
+            llm_concurrency=args.llm_concurrency,
+            llm_batch_tokens=args.llm_batch_tokens,
+            parse_workers=args.parse_workers,
+            site_deadline=args.site_deadline,
+            archive=archive,
+            replay=args.replay,
+            speculative=args.speculative_fetches,
+        )
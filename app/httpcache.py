@@ -0,0 +1,247 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+
+import metrics
+from urls import normalize_url
+
+HTTP_CACHE_PATH = "./data/http_cache.db"
+HTTP_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Cache writes are committed together by a background thread every
+# FLUSH_INTERVAL seconds or as soon as FLUSH_SIZE of them are waiting
+FLUSH_INTERVAL = 1.0
+FLUSH_SIZE = 200
+
+_STOP = "stop"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    etag: str | None
+    last_modified: str | None
+    encoding: str
+    body: bytes
+
+
+class HttpCache:
+    """
+    Persistent response cache used to revalidate pages between runs.
+    Only responses carrying an ETag or Last-Modified are kept, since those are
+    the ones a server can answer with 304. Bodies are zlib-compressed and the
+    least recently used entries are evicted above `max_bytes` on disk.
+    Writes are queued and compressed and committed in batches by a
+    background thread, so the crawler never waits on the disk; close()
+    commits the ones still queued.
+    """
+
+    def __init__(
+        self, path: str = HTTP_CACHE_PATH, max_bytes: int = HTTP_CACHE_MAX_BYTES
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only syncs at checkpoints and is still crash safe
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Opened on first use so that importing a crawler has no side effects
+        if self._conn is None:
+            self._conn = self._connect()
+            self._create_table()
+        return self._conn
+
+    def _create_table(self) -> None:
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses(
+                url TEXT PRIMARY KEY NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                encoding TEXT,
+                body BLOB,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)"
+        )
+        self._conn.commit()
+        self.size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def lookup(self, url: str) -> CachedResponse | None:
+        key = normalize_url(url)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, encoding, body FROM responses WHERE url = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, encoding, body = row
+        return CachedResponse(key, etag, last_modified, encoding, zlib.decompress(body))
+
+    @staticmethod
+    def conditional_headers(entry: CachedResponse | None) -> dict:
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def revalidated(self, entry: CachedResponse) -> None:
+        """Record a 304 for the entry"""
+        self.hits += 1
+        metrics.CACHE_LOOKUPS.inc(cache="http", result="revalidated")
+        now = time.time()
+        self._submit("revalidated", (now, now, entry.url))
+
+    def store(self, url: str, headers, body: bytes, encoding: str) -> None:
+        self.misses += 1
+        metrics.CACHE_LOOKUPS.inc(cache="http", result="downloaded")
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        self._submit(
+            "store",
+            (normalize_url(url), etag, last_modified, encoding, body, time.time()),
+        )
+
+    def _submit(self, kind: str, params: tuple) -> None:
+        with self._lock:
+            if self._thread is None:
+                # The writer needs the table, created with the first connection
+                _ = self.conn
+                self._thread = threading.Thread(
+                    target=self._run, name="http-cache-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+        self._queue.put((kind, params))
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < FLUSH_SIZE and batch[-1][0] != _STOP:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                batch = self._collect()
+                try:
+                    with conn:
+                        for kind, params in batch:
+                            if kind == "store":
+                                self._write(conn, *params)
+                            elif kind == "revalidated":
+                                conn.execute(
+                                    """
+                                    UPDATE responses SET fetched_at = ?, accessed_at = ?
+                                    WHERE url = ?
+                                    """,
+                                    params,
+                                )
+                except sqlite3.Error as e:
+                    logger.error(
+                        "HTTP cache error while writing %d entries: %s", len(batch), e
+                    )
+                if batch[-1][0] == _STOP:
+                    return
+        finally:
+            conn.close()
+
+    def _write(
+        self,
+        conn: sqlite3.Connection,
+        key: str,
+        etag: str | None,
+        last_modified: str | None,
+        encoding: str,
+        body: bytes,
+        now: float,
+    ) -> None:
+        compressed = zlib.compress(body)
+        if len(compressed) > self.max_bytes:
+            return
+
+        old = conn.execute(
+            "SELECT size FROM responses WHERE url = ?", (key,)
+        ).fetchone()
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO responses
+                (url, etag, last_modified, encoding, body, size, fetched_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (key, etag, last_modified, encoding, compressed, len(compressed), now, now),
+        )
+        self.size += len(compressed) - (old[0] if old else 0)
+        self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        while self.size > self.max_bytes:
+            rows = conn.execute(
+                "SELECT url, size FROM responses ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self.size = 0
+                return
+            for url, size in rows:
+                conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.size -= size
+                if self.size <= self.max_bytes:
+                    return
+
+    def stats(self) -> dict:
+        return {"revalidated": self.hits, "downloaded": self.misses, "bytes": self.size}
+
+    def close(self) -> None:
+        """Commit the queued writes and close the connections"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put((_STOP, None))
+            thread.join()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
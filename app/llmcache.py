@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from matcher import normalize_text
+
+LLM_CACHE_PATH = "./data/llm_cache.db"
+
+
+def template_hash(prompt_template: str) -> str:
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+
+
+def cache_key(prompt_template: str, model: str, text: str, site: str) -> str:
+    """
+    Content address of a model call: the same prompt, model, input text
+    (up to case, accents and whitespace) and site always give the same key.
+    The site is part of the prompt, two companies with the same text, e.g.
+    an empty or a parked page, get different answers.
+    """
+    digest = hashlib.sha256()
+    for part in (template_hash(prompt_template), model, normalize_text(text), site):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LLMCache:
+    """
+    Persistent cache of parsed model results keyed by cache_key().
+    Since the key includes the prompt templates, editing prompt.txt or
+    prompt_batch.txt makes old entries unreachable; purge() drops them, or
+    everything.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH) -> None:
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results(
+                    key TEXT PRIMARY KEY NOT NULL,
+                    template_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT result FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            metrics.CACHE_LOOKUPS.inc(cache="llm", result="miss")
+            return None
+        self.hits += 1
+        metrics.CACHE_LOOKUPS.inc(cache="llm", result="hit")
+        return json.loads(row[0])
+
+    def put(self, key: str, prompt_template: str, model: str, result: dict) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    template_hash(prompt_template),
+                    model,
+                    json.dumps(result),
+                    time.time(),
+                ),
+            )
+            self.conn.commit()
+
+    def purge(self, keep_template: str | None = None) -> int:
+        """
+        Delete the entries made with another prompt template than
+        `keep_template`, or all of them if it is None.
+        """
+        with self._lock:
+            if keep_template is None:
+                cursor = self.conn.execute("DELETE FROM results")
+            else:
+                cursor = self.conn.execute(
+                    "DELETE FROM results WHERE template_hash != ?",
+                    (template_hash(keep_template),),
+                )
+            self.conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -1,18 +1,42 @@
 import argparse
+import copy
+from multiprocessing import Process
 
+import metrics
 from db import create_db_and_table, fill_database
 from scraper import scrape_sites
 
 
-def app(xls_file: str) -> None:
+def crawl(args, index: int = 0) -> None:
+    """One crawler process, serving its own metrics on --metrics-port + index"""
+    if args.metrics_port is not None:
+        args = copy.copy(args)
+        args.metrics_port += index
+    metrics.setup(args)
+    scrape_sites()
+
+
+def app(args) -> None:
+    metrics.setup_logging(args)
+
     # Database part
     create_db_and_table()
 
-    # If database is empty, fill with the data from the .xls file
-    fill_database(xls_file)
+    # Ingest the .xlsx file, only new or changed companies are written
+    fill_database(args.xlsx_file)
 
-    # Scraper part
-    scrape_sites()
+    # Scraper part, each process claims its own companies from the database
+    if args.workers == 1:
+        crawl(args)
+        return
+
+    processes = [
+        Process(target=crawl, args=(args, index)) for index in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
 
 
 if __name__ == "__main__":
@@ -20,5 +44,8 @@ if __name__ == "__main__":
     parser.add_argument(
         "--xlsx_file", type=str, help="Path to the xls file", required=True
     )
-    args = parser.parse_args()
-    app(args.xlsx_file)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of crawler processes"
+    )
+    metrics.add_arguments(parser)
+    app(parser.parse_args())
@@ -0,0 +1,159 @@
+import re
+import unicodedata
+from dataclasses import dataclass
+from urllib.parse import unquote, urlparse
+
+# Keyword sets by language. Keywords are normalized like the text they are
+# matched against, so accents don't matter.
+KEYWORDS = {
+    # Path of a link that probably leads to an about page
+    "about_url": {
+        "en": ("about", "who-we-are", "our", "information", "who"),
+        "es": ("acerca", "sobre", "informacion", "quienes", "nosotros"),
+        "pt": ("sobre", "quem-somos", "institucional", "nossa", "nosso"),
+    },
+    # Text found on an about page
+    "about_text": {
+        "en": ("about us", "who we are"),
+        "es": ("acerca de", "quienes somos", "sobre"),
+        "pt": ("quem somos", "sobre nos"),
+    },
+    # Phrases announcing a purpose statement
+    "purpose": {
+        "en": ("our purpose", "our purpose is"),
+        "es": ("nuestro proposito", "nuestro proposito es"),
+        "pt": ("nosso proposito", "nosso proposito e"),
+    },
+    # Weaker signs of a purpose statement, used to rank passages
+    "mission": {
+        "en": ("our mission", "our vision", "we exist to", "we aim to", "we strive to"),
+        "es": ("nuestra mision", "nuestra vision", "existimos para", "buscamos"),
+        "pt": ("nossa missao", "nossa visao", "existimos para", "buscamos"),
+    },
+}
+
+# Combining marks left by NFKD are dropped so that accented letters fold to
+# ASCII, any other run of whitespace or non-ASCII becomes a single space
+_CLEANUP = re.compile(r"([̀-ͯ]+)|[\s\x80-\U0010ffff]+")
+
+
+def _cleanup(match: re.Match) -> str:
+    return "" if match.group(1) else " "
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, accent-folded ASCII text with whitespace collapsed"""
+    return _CLEANUP.sub(_cleanup, unicodedata.normalize("NFKD", text.lower())).strip()
+
+
+@dataclass(frozen=True)
+class Match:
+    keyword: str
+    keyword_set: str
+    language: str
+    position: int
+
+
+def _trie_pattern(words) -> str:
+    """Regex matching the longest of `words`, with common prefixes shared"""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [
+            re.escape(char) + build(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if "" in node else group
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Match every keyword of every set in a single scan of the text.
+    The keywords are compiled into one prefix-trie regex tried at each
+    position, so adding keywords or languages does not add passes. Like
+    Aho-Corasick, overlapping matches are all reported: the longest keyword
+    starting at a position is found by the regex, the shorter ones it
+    contains as prefixes are looked up from a table.
+    """
+
+    def __init__(self, keyword_sets: dict[str, dict[str, tuple[str, ...]]]) -> None:
+        outputs: dict[str, list[tuple[str, str]]] = {}
+        for keyword_set, languages in keyword_sets.items():
+            for language, keywords in languages.items():
+                for keyword in keywords:
+                    outputs.setdefault(normalize_text(keyword), []).append(
+                        (keyword_set, language)
+                    )
+
+        self._matches = {
+            keyword: [
+                (prefix, keyword_set, language)
+                for prefix in outputs
+                if keyword.startswith(prefix)
+                for keyword_set, language in outputs[prefix]
+            ]
+            for keyword in outputs
+        }
+        self._pattern = re.compile(f"(?=({_trie_pattern(outputs)}))")
+
+    def iter_matches(self, text: str, keyword_sets=None):
+        """Yield every Match in normalized `text`, optionally only for some sets"""
+        for found in self._pattern.finditer(text):
+            for keyword, keyword_set, language in self._matches[found.group(1)]:
+                if keyword_sets is None or keyword_set in keyword_sets:
+                    yield Match(keyword, keyword_set, language, found.start())
+
+    def first(self, text: str, keyword_set: str) -> Match | None:
+        return next(self.iter_matches(text, (keyword_set,)), None)
+
+    def contains(self, text: str, keyword_set: str) -> bool:
+        return self.first(text, keyword_set) is not None
+
+    def matched_sets(self, text: str) -> dict[str, set[str]]:
+        """The languages that matched for each keyword set"""
+        result: dict[str, set[str]] = {}
+        for match in self.iter_matches(text):
+            result.setdefault(match.keyword_set, set()).add(match.language)
+        return result
+
+
+MATCHER = KeywordMatcher(KEYWORDS)
+
+
+def is_about_url(url: str) -> bool:
+    """Return True if the path of the URL contains an about-like keyword"""
+    path = normalize_text(unquote(urlparse(url).path))
+    return MATCHER.contains(path, "about_url")
+
+
+def about_score(url: str, anchor_text: str = "") -> float:
+    """
+    How likely a link leads to an about page, from its path and anchor
+    text. Among links scoring the same, shallower paths come first.
+    """
+    path = normalize_text(unquote(urlparse(url).path))
+    anchor = MATCHER.matched_sets(normalize_text(anchor_text))
+
+    score = 0.0
+    if MATCHER.contains(path, "about_url"):
+        score += 2
+    if "about_text" in anchor:
+        score += 3
+    if "about_url" in anchor:
+        score += 1
+    if "purpose" in anchor or "mission" in anchor:
+        score += 2
+    return score - 0.1 * path.strip("/").count("/")
@@ -0,0 +1,357 @@
+import bisect
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from urls import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SUMMARY_INTERVAL = 60
+PROFILE_DIR = "./data"
+
+REGISTRY: dict[str, "Metric"] = {}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Metric:
+    """A named metric with one value per combination of label values"""
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help = help_text
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        REGISTRY[name] = self
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def samples(self):
+        """(name suffix, labels, value) of every series"""
+        with self._lock:
+            return [("", key, value) for key, value in self._values.items()]
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                _format_labels(key) or "total": value
+                for key, value in self._values.items()
+            }
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the block as in progress while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per bucket counts (the last one is +Inf), sum, count
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket
+                    samples.append(("_bucket", key + (("le", bound),), cumulative))
+                samples.append(("_sum", key, total))
+                samples.append(("_count", key, count))
+        return samples
+
+    def _quantile(self, counts: list[int], count: int, q: float) -> float:
+        # Upper bound of the bucket holding the quantile
+        rank, cumulative = q * count, 0
+        for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                _format_labels(key) or "total": {
+                    "count": count,
+                    "sum": round(total, 3),
+                    "p50": self._quantile(counts, count, 0.5),
+                    "p95": self._quantile(counts, count, 0.95),
+                    "p99": self._quantile(counts, count, 0.99),
+                }
+                for key, (counts, total, count) in self._values.items()
+            }
+
+
+STAGE_SECONDS = Histogram(
+    "crawler_stage_seconds",
+    "Time spent in each stage: fetch, parse, match, llm, db_write, archive",
+)
+IN_FLIGHT = Gauge("crawler_in_flight", "Operations currently running, by stage")
+ERRORS = Counter("crawler_errors_total", "Errors by stage and exception class")
+HTTP_RESPONSES = Counter("crawler_http_responses_total", "HTTP responses by status")
+CACHE_LOOKUPS = Counter(
+    "crawler_cache_lookups_total", "Cache lookups by cache and result"
+)
+SITES = Counter("crawler_sites_total", "Crawled sites by saved status")
+LLM_REQUESTS = Counter("crawler_llm_requests_total", "LLM requests by kind and result")
+DB_ROWS = Counter(
+    "crawler_db_rows_written_total", "Rows written by the write-behind store"
+)
+
+
+def render_prometheus() -> str:
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in list(REGISTRY.values()):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, labels, value in metric.samples():
+            lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> dict:
+    return {name: metric.summary() for name, metric in list(REGISTRY.items())}
+
+
+# Per-site tracing and profiling, see configure()
+_trace_path: str | None = None
+_trace_lock = threading.Lock()
+_profile_url: str | None = None
+_trace: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "trace", default=None
+)
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Time a stage of the pipeline: observed in STAGE_SECONDS, counted in
+    IN_FLIGHT while it runs and in ERRORS if it raises. Inside site(), the
+    span is also added to the site's trace.
+    """
+    start = time.perf_counter()
+    IN_FLIGHT.inc(stage=stage)
+    try:
+        yield
+    except Exception as e:
+        ERRORS.inc(stage=stage, error=type(e).__name__)
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        IN_FLIGHT.dec(stage=stage)
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        events = _trace.get()
+        if events is not None:
+            events.append({"stage": stage, "seconds": round(elapsed, 6), **attributes})
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record time spent in a stage that was measured elsewhere"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    events = _trace.get()
+    if events is not None:
+        events.append({"stage": stage, "seconds": round(seconds, 6)})
+
+
+@contextmanager
+def site(url: str):
+    """
+    Scope of the crawl of one site. With a trace file, the spans of the
+    site are written to it as one JSON line; if it is the site to profile,
+    it runs under cProfile. In the async crawler other sites keep running
+    meanwhile, so profile with a concurrency of 1 for a clean profile.
+    """
+    profiler = None
+    if _profile_url is not None and normalize_url(url) == _profile_url:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    token = _trace.set([]) if _trace_path is not None else None
+    start = time.time()
+    try:
+        yield
+    finally:
+        if token is not None:
+            record = {
+                "site": url,
+                "started": start,
+                "seconds": round(time.time() - start, 6),
+                "spans": _trace.get(),
+            }
+            _trace.reset(token)
+            with _trace_lock, open(_trace_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+        if profiler is not None:
+            profiler.disable()
+            _save_profile(url, profiler)
+
+
+def _save_profile(url: str, profiler: cProfile.Profile) -> None:
+    path = os.path.join(PROFILE_DIR, f"profile-{urlparse(url).netloc or 'site'}.prof")
+    profiler.dump_stats(path)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(20)
+    logger.info("Profile of %s saved to %s\n%s", url, path, report.getvalue())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            body, content_type = render_prometheus(), "text/plain; version=0.0.4"
+        elif self.path.startswith("/summary"):
+            body, content_type = json.dumps(summary()), "application/json"
+        else:
+            self.send_error(404)
+            return
+        payload = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Expose /metrics (Prometheus) and /summary (JSON) from a background thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+def log_summary_every(interval: float = SUMMARY_INTERVAL) -> None:
+    def run():
+        while True:
+            time.sleep(interval)
+            logger.info("Metrics summary: %s", json.dumps(summary()))
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def configure(trace_path: str | None = None, profile_url: str | None = None) -> None:
+    global _trace_path, _profile_url
+    _trace_path = trace_path
+    _profile_url = normalize_url(profile_url) if profile_url else None
+
+
+def add_arguments(parser) -> None:
+    """Logging and metrics options shared by the entry points"""
+    group = parser.add_argument_group("metrics")
+    group.add_argument("--log-level", default="INFO")
+    group.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on this port, crawler process i on port + i",
+    )
+    group.add_argument(
+        "--summary-interval",
+        type=float,
+        default=0,
+        help="Log a JSON summary of the metrics every this many seconds",
+    )
+    group.add_argument(
+        "--trace-file", help="Append a JSON trace of every site to this file"
+    )
+    group.add_argument(
+        "--profile-site", help="Run the crawl of this URL under cProfile"
+    )
+
+
+def setup_logging(args) -> None:
+    logging.basicConfig(
+        level=args.log_level.upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+
+def setup(args) -> None:
+    """
+    Configure logging and metrics from the options of add_arguments(). The
+    metrics live in the registry of the process calling it, so crawler
+    processes each call it themselves.
+    """
+    setup_logging(args)
+    configure(args.trace_file, args.profile_site)
+    if args.metrics_port is not None:
+        serve(args.metrics_port)
+    if args.summary_interval:
+        log_summary_every(args.summary_interval)
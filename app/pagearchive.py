@@ -0,0 +1,436 @@
+import base64
+import contextvars
+import glob
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import metrics
+import zstandard
+from fetcher import CHUNK_SIZE, Response, StreamReader, check_content_type
+from urls import normalize_url
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = "./data/archive"
+# A new segment file is started once the current one reaches this size
+SEGMENT_BYTES = 1024 * 1024 * 1024
+ZSTD_LEVEL = 3
+SEGMENT_SUFFIX = ".warc.zst"
+# Index entries: key hash, offset and compressed length of the record
+INDEX_ENTRY = struct.Struct(">8sQI")
+
+
+class NotArchived(Exception):
+    """The page is not in the archive, in replay mode nothing is downloaded"""
+
+
+@dataclass
+class ArchivedPage:
+    url: str
+    response_url: str
+    content_type: str | None
+    encoding: str
+    body: bytes
+    date: str
+    ric: str | None = None
+    truncated: bool = False
+
+
+def _key(kind: str, value: str) -> bytes:
+    return hashlib.blake2b(f"{kind}:{value}".encode("utf-8"), digest_size=8).digest()
+
+
+def url_key(url: str) -> bytes:
+    return _key("url", normalize_url(url))
+
+
+def ric_key(ric: str) -> bytes:
+    return _key("ric", ric)
+
+
+def _header(headers: dict, name: str) -> str | None:
+    name = name.lower()
+    return next((value for key, value in headers.items() if key.lower() == name), None)
+
+
+def build_record(
+    url: str, response: Response, ric: str | None = None, date: str | None = None
+) -> bytes:
+    """A WARC resource record holding the body of the response"""
+    body = response.body
+    digest = base64.b32encode(hashlib.sha1(body).digest()).decode("ascii")
+    headers = {
+        "WARC-Type": "resource",
+        "WARC-Record-ID": f"<urn:uuid:{uuid.uuid4()}>",
+        "WARC-Date": date or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "WARC-Target-URI": url,
+        "WARC-Payload-Digest": f"sha1:{digest}",
+        "Content-Type": _header(response.headers, "Content-Type")
+        or "application/octet-stream",
+        "Content-Length": str(len(body)),
+        "X-Crawler-Encoding": response.encoding,
+    }
+    if response.url != url:
+        headers["X-Crawler-Response-URI"] = response.url
+    if ric:
+        headers["X-Crawler-RIC"] = ric
+    if response.truncated:
+        headers["X-Crawler-Truncated"] = "true"
+
+    head = "WARC/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+    return head.encode("utf-8") + b"\r\n" + body + b"\r\n\r\n"
+
+
+def parse_record(data: bytes) -> ArchivedPage:
+    head, _, rest = data.partition(b"\r\n\r\n")
+    headers = {}
+    for line in head.decode("utf-8").split("\r\n")[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    url = headers["WARC-Target-URI"]
+    return ArchivedPage(
+        url=url,
+        response_url=headers.get("X-Crawler-Response-URI", url),
+        content_type=headers.get("Content-Type"),
+        encoding=headers.get("X-Crawler-Encoding", "utf-8"),
+        body=rest[: int(headers["Content-Length"])],
+        date=headers.get("WARC-Date", ""),
+        ric=headers.get("X-Crawler-RIC"),
+        truncated=headers.get("X-Crawler-Truncated") == "true",
+    )
+
+
+class _Segment:
+    """A closed segment and its sorted index, both memory-mapped"""
+
+    def __init__(self, path: str, index) -> None:
+        self.path = path
+        self._index = index
+        self._count = len(index) // INDEX_ENTRY.size
+        self._data: mmap.mmap | None = None
+
+    @classmethod
+    def open(cls, path: str) -> "_Segment | None":
+        if os.path.exists(path + ".idx"):
+            with open(path + ".idx", "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                return cls(path, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        if os.path.exists(path + ".idx.part"):
+            # Still being written, or its writer died before sorting it
+            with open(path + ".idx.part", "rb") as f:
+                data = f.read()
+            data = data[: len(data) - len(data) % INDEX_ENTRY.size]
+            return cls(path, _sorted_index(INDEX_ENTRY.iter_unpack(data)))
+        return None
+
+    def _key_at(self, position: int) -> bytes:
+        start = position * INDEX_ENTRY.size
+        return self._index[start : start + 8]
+
+    def find(self, key: bytes) -> list[tuple[int, int]]:
+        """(offset, length) of the records under the key, oldest first"""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self._count and self._key_at(low) == key:
+            _, offset, length = INDEX_ENTRY.unpack_from(
+                self._index, low * INDEX_ENTRY.size
+            )
+            found.append((offset, length))
+            low += 1
+        return found
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self._data is None or offset + length > len(self._data):
+            if self._data is not None:
+                self._data.close()
+            with open(self.path, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data[offset : offset + length]
+
+    def close(self) -> None:
+        for buffer in (self._data, self._index):
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+        self._data = None
+
+
+def _sorted_index(entries) -> bytes:
+    return b"".join(INDEX_ENTRY.pack(*entry) for entry in sorted(entries))
+
+
+class _SegmentWriter:
+    """
+    The segment being appended to. Its index entries are journaled to
+    .idx.part as records are written, and sorted into .idx on close.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.size = 0
+        self.entries: list[tuple[bytes, int, int]] = []
+        self._file = open(path, "ab")
+        self._journal = open(path + ".idx.part", "ab")
+
+    def append(self, keys: list[bytes], frame: bytes) -> tuple[int, int]:
+        offset = self.size
+        self._file.write(frame)
+        self._file.flush()
+        self.size += len(frame)
+        for key in keys:
+            entry = (key, offset, len(frame))
+            self.entries.append(entry)
+            self._journal.write(INDEX_ENTRY.pack(*entry))
+        self._journal.flush()
+        return offset, len(frame)
+
+    def close(self) -> _Segment:
+        self._file.close()
+        self._journal.close()
+        index = _sorted_index(self.entries)
+        with open(self.path + ".idx.tmp", "wb") as f:
+            f.write(index)
+        os.replace(self.path + ".idx.tmp", self.path + ".idx")
+        os.remove(self.path + ".idx.part")
+        return _Segment(self.path, index)
+
+
+_company: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "company", default=None
+)
+
+
+@contextmanager
+def company(ric: str):
+    """Pages archived inside the block are indexed under the company's RIC"""
+    token = _company.set(ric)
+    try:
+        yield
+    finally:
+        _company.reset(token)
+
+
+class PageArchive:
+    """
+    Append-only archive of the fetched pages, so extraction and prompting
+    can be run again offline. Each page is a WARC resource record compressed
+    as its own zstd frame, appended to segment files of about
+    `segment_bytes`. Every segment has a sorted index from the hash of the
+    page URL, and of the company's RIC, to the offset of its records; the
+    indexes and segments are memory-mapped and searched in place. Each
+    archive object writes its own segments, so crawler processes can share
+    the directory, and the newest record of a URL wins.
+    """
+
+    def __init__(
+        self,
+        path: str = ARCHIVE_DIR,
+        segment_bytes: int = SEGMENT_BYTES,
+        level: int = ZSTD_LEVEL,
+    ) -> None:
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.level = level
+        self.written = 0
+        self.bytes_written = 0
+        self.replayed = 0
+        self._lock = threading.Lock()
+        self._segments: list[_Segment] | None = None
+        self._writer: _SegmentWriter | None = None
+        self._segment_number = 0
+        # Segments of different processes and archives never share a file:
+        # they are named after the pid of the writing process and this token
+        self._token = uuid.uuid4().hex[:8]
+        self._pid = os.getpid()
+        self._digests: dict[str, bytes] = {}
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def _load_segments(self) -> list[_Segment]:
+        # Opened on first use so that importing a crawler has no side effects
+        if self._segments is None:
+            writing = self._writer.path if self._writer else None
+            self._segments = []
+            for path in sorted(
+                glob.glob(os.path.join(self.path, "*" + SEGMENT_SUFFIX))
+            ):
+                if path == writing:
+                    continue
+                segment = _Segment.open(path)
+                if segment is None:
+                    logger.warning("Archive segment %s has no index, skipped", path)
+                else:
+                    self._segments.append(segment)
+        return self._segments
+
+    def _new_writer(self) -> _SegmentWriter:
+        os.makedirs(self.path, exist_ok=True)
+        self._segment_number += 1
+        name = (
+            f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self._token}-"
+            f"{self._segment_number:05d}{SEGMENT_SUFFIX}"
+        )
+        return _SegmentWriter(os.path.join(self.path, name))
+
+    def write(self, url: str, response: Response) -> None:
+        """Archive the body of the response, under the current company if any"""
+        digest = hashlib.sha1(response.body).digest()
+        key = normalize_url(url)
+        # The same page seen twice in a run, e.g. revalidated, is kept once
+        with self._lock:
+            if self._digests.get(key) == digest:
+                return
+
+        ric = _company.get()
+        with metrics.span("archive"):
+            frame = self._compressor.compress(build_record(url, response, ric))
+            keys = [url_key(url)] + ([ric_key(ric)] if ric else [])
+
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Forked with the archive: the parent's segment is its own
+                    self._pid = os.getpid()
+                    self._writer = None
+                    self._segment_number = 0
+                if self._writer is None:
+                    self._writer = self._new_writer()
+                self._writer.append(keys, frame)
+                self._digests[key] = digest
+                self.written += 1
+                self.bytes_written += len(frame)
+
+                if self._writer.size >= self.segment_bytes:
+                    self._close_writer()
+
+    def _close_writer(self) -> None:
+        segment = self._writer.close()
+        self._writer = None
+        if self._segments is not None:
+            self._segments.append(segment)
+
+    def _records(self, key: bytes) -> list[ArchivedPage]:
+        """Every record under the key, oldest first"""
+        frames = []
+        with self._lock:
+            for segment in self._load_segments():
+                frames.extend(
+                    segment.read(offset, length) for offset, length in segment.find(key)
+                )
+            if self._writer is not None:
+                writer_frames = [
+                    (offset, length)
+                    for entry_key, offset, length in self._writer.entries
+                    if entry_key == key
+                ]
+                if writer_frames:
+                    with open(self._writer.path, "rb") as f:
+                        for offset, length in writer_frames:
+                            f.seek(offset)
+                            frames.append(f.read(length))
+        return [parse_record(self._decompressor.decompress(frame)) for frame in frames]
+
+    def lookup(self, url: str) -> ArchivedPage | None:
+        """The newest record of the page"""
+        key = normalize_url(url)
+        for page in reversed(self._records(url_key(url))):
+            # Hash collisions are told apart by the URL of the record
+            if normalize_url(page.url) == key:
+                metrics.CACHE_LOOKUPS.inc(cache="archive", result="hit")
+                return page
+        metrics.CACHE_LOOKUPS.inc(cache="archive", result="miss")
+        return None
+
+    def pages(self, ric: str) -> list[ArchivedPage]:
+        """Every page archived while crawling the company, oldest first"""
+        return [page for page in self._records(ric_key(ric)) if page.ric == ric]
+
+    def scan(self, url: str, scanner, max_bytes: int) -> Response:
+        """
+        Replay the archived page through `scanner` like the crawlers' scan
+        functions do with a download. Raise NotArchived if it is missing.
+        """
+        page = self.lookup(url)
+        if page is None:
+            raise NotArchived(url)
+
+        reader = StreamReader(scanner, page.encoding, max_bytes)
+        check_content_type(page.content_type, reader.content_types)
+        for start in range(0, len(page.body), CHUNK_SIZE):
+            if reader.feed(page.body[start : start + CHUNK_SIZE]):
+                break
+        else:
+            # Like the download that was stopped early, a truncated page
+            # never reaches its end
+            if not page.truncated:
+                reader.finish()
+        reader.observe()
+        self.replayed += 1
+
+        return Response(
+            url=page.response_url,
+            status=200,
+            headers={"Content-Type": page.content_type} if page.content_type else {},
+            body=reader.body,
+            encoding=reader.encoding,
+            from_cache=True,
+            truncated=not reader.complete,
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._close_writer()
+            for segment in self._segments or []:
+                segment.close()
+            self._segments = None
+
+    def stats(self) -> dict:
+        return {
+            "written": self.written,
+            "mb_written": round(self.bytes_written / 1024 / 1024, 2),
+            "replayed": self.replayed,
+        }
+
+
+def add_arguments(parser) -> None:
+    """Page archive options shared by the crawlers"""
+    group = parser.add_argument_group("archive")
+    group.add_argument(
+        "--archive",
+        action="store_true",
+        help="Archive the fetched pages, the archive grows with every run",
+    )
+    group.add_argument(
+        "--archive-dir", default=ARCHIVE_DIR, help="Where fetched pages are archived"
+    )
+    group.add_argument(
+        "--replay",
+        action="store_true",
+        help="Read every page from the archive instead of the network",
+    )
+
+
+def directory(args) -> str | None:
+    """Archive directory picked by the options, None for no archive"""
+    if not args.archive and not args.replay:
+        return None
+    return args.archive_dir
+
+
+def from_arguments(args) -> PageArchive | None:
+    path = directory(args)
+    return PageArchive(path) if path is not None else None
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from typing import Any
+
+import metrics
+from urls import normalize_url
+
+PAGE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class PageCache:
+    """
+    In-memory LRU cache of parsed pages for the duration of a run.
+    The budget is measured on the size of the downloaded HTML, the least
+    recently used pages are evicted once it is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = PAGE_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, url: str) -> Any | None:
+        key = normalize_url(url)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            metrics.CACHE_LOOKUPS.inc(cache="page", result="miss")
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        metrics.CACHE_LOOKUPS.inc(cache="page", result="hit")
+        return entry[0]
+
+    def put(self, url: str, page: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+
+        key = normalize_url(url)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+
+        self._entries[key] = (page, size)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "pages": len(self._entries),
+            "bytes": self.size,
+        }
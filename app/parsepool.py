@@ -0,0 +1,86 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import metrics
+from extract import PageScanner
+from passages import page_text
+
+PARSE_WORKERS = os.cpu_count() or 1
+# Pages waiting for or being parsed per worker, fetches wait beyond that
+PARSE_QUEUE_PER_WORKER = 4
+# The crawler runs threads (the write-behind store, metrics), forking it
+# could copy a lock held by one of them into a worker. Workers are started
+# from a clean server process instead, or spawned where there is none.
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+@dataclass
+class ParseResult:
+    """What comes back from a parse: cheap to pickle, unlike a parser"""
+
+    links: list[tuple[str, str]]
+    text: str
+    found_phrase: str | None = None
+
+
+def scan_result(scanner: PageScanner) -> ParseResult:
+    return ParseResult(
+        scanner.page().links, page_text(scanner.text), scanner.found_phrase
+    )
+
+
+def parse_html(
+    body: bytes, encoding: str, keyword_set: str | None = None
+) -> ParseResult:
+    """Parse a downloaded page, run in the worker processes"""
+    scanner = PageScanner(keyword_set=keyword_set)
+    scanner.feed(body.decode(encoding, errors="replace"))
+    scanner.close()
+    return scan_result(scanner)
+
+
+class ParsePool:
+    """
+    Process pool parsing pages off the event loop, so parsing and text
+    cleanup use every core instead of the crawler's one. At most
+    `workers * queue_per_worker` pages are submitted at once, callers wait
+    for a slot, which keeps downloaded bodies from piling up in memory.
+    """
+
+    def __init__(
+        self,
+        workers: int = PARSE_WORKERS,
+        queue_per_worker: int = PARSE_QUEUE_PER_WORKER,
+    ) -> None:
+        self.workers = workers
+        self.parsed = 0
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD)
+        )
+        self._semaphore = asyncio.BoundedSemaphore(workers * queue_per_worker)
+
+    def __enter__(self) -> "ParsePool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    async def parse(
+        self, body: bytes, encoding: str, keyword_set: str | None = None
+    ) -> ParseResult:
+        async with self._semaphore:
+            # Includes the wait for a free worker
+            with metrics.span("parse", pooled=True):
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, parse_html, body, encoding, keyword_set
+                )
+        self.parsed += 1
+        return result
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
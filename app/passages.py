@@ -0,0 +1,97 @@
+import re
+
+from matcher import MATCHER, normalize_text
+
+# Pages of a site are kept apart in the crawled text, and passages within a
+# page are one per line
+PAGE_SEPARATOR = "\n\n"
+PASSAGE_SEPARATOR = "\n"
+
+# Longer blocks are split into sentences
+MAX_PASSAGE_CHARS = 400
+# Shorter passages are menu entries, buttons and the like unless they
+# carry a signal themselves, e.g. an "Our purpose" heading
+MIN_PASSAGE_CHARS = 30
+
+# Weight of each keyword set in a passage's score
+SIGNAL_WEIGHTS = {"purpose": 3, "mission": 2, "about_text": 1}
+# A heading with a signal is usually followed by the statement itself
+FOLLOWING_WEIGHT = 1
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+")
+
+
+def split_passages(text: str) -> list[str]:
+    """Normalized blocks of `text`, long ones cut into sentences"""
+    passages = []
+    for block in text.splitlines():
+        block = normalize_text(block)
+        if not block:
+            continue
+        if len(block) <= MAX_PASSAGE_CHARS:
+            passages.append(block)
+        else:
+            passages.extend(s for s in _SENTENCE_END.split(block) if s)
+    return passages
+
+
+def page_text(text: str) -> str:
+    """Visible text of a page as the crawlers store it, one passage per line"""
+    return PASSAGE_SEPARATOR.join(split_passages(text))
+
+
+def score_passage(passage: str) -> int:
+    return sum(
+        SIGNAL_WEIGHTS[match.keyword_set]
+        for match in MATCHER.iter_matches(passage, SIGNAL_WEIGHTS)
+    )
+
+
+def select_passages(text: str, max_chars: int) -> str:
+    """
+    The passages of the crawled `text` most likely to state the purpose,
+    within `max_chars`. Passages found on more than one page of the site
+    (navigation, footers, cookie banners) are dropped, the others are
+    ranked by their purpose signals and the best ones kept in page order.
+    Leftover budget goes to the unranked passages so the model still has
+    something to infer from. The same page read twice counts once, and if
+    every passage is shared they are all ranked rather than dropped.
+    """
+    # dict.fromkeys keeps the first copy of each page, in order
+    pages = [
+        page.split(PASSAGE_SEPARATOR)
+        for page in dict.fromkeys(text.split(PAGE_SEPARATOR))
+    ]
+
+    pages_with = {}
+    for page in pages:
+        for passage in set(page):
+            pages_with[passage] = pages_with.get(passage, 0) + 1
+
+    unique = list(dict.fromkeys(passage for page in pages for passage in page))
+    passages = [
+        passage for passage in unique if len(pages) == 1 or pages_with[passage] == 1
+    ] or unique
+
+    scores = [score_passage(passage) for passage in passages]
+    for i in range(len(scores) - 1, 0, -1):
+        if scores[i - 1]:
+            scores[i] += FOLLOWING_WEIGHT
+
+    candidates = [
+        i
+        for i, passage in enumerate(passages)
+        if scores[i] or len(passage) >= MIN_PASSAGE_CHARS
+    ]
+    ranked = sorted(candidates, key=lambda i: (-scores[i], i))
+
+    selected = {}
+    remaining = max_chars
+    for i in ranked:
+        if remaining <= 0:
+            break
+        passage = passages[i][:remaining]
+        selected[i] = passage
+        remaining -= len(passage) + 1
+
+    return " ".join(selected[i] for i in sorted(selected))
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+MIN_HOST_DELAY = 1.0
+MAX_HOST_CONNECTIONS = 2
+BACKOFF_STATUSES = {429, 503}
+DEFAULT_BACKOFF = 30.0
+MAX_BACKOFF = 600.0
+# Longest Crawl-delay of a robots.txt that is honoured
+MAX_CRAWL_DELAY = 30.0
+# A host that timed out this many times in a row is not fetched from for
+# BREAKER_COOLDOWN seconds, then tried again
+BREAKER_TIMEOUTS = 3
+BREAKER_COOLDOWN = 900.0
+
+
+class HostUnavailable(TimeoutError):
+    """The host keeps timing out, its requests fail without being sent"""
+
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Return the Retry-After header in seconds, it may be a delay or an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at one token every `min_delay` seconds.
+    Callers reserve a token and get back how long they must wait for it,
+    so concurrent callers are spread out instead of all waking up together.
+    """
+
+    def __init__(self, min_delay: float, burst: int = 1) -> None:
+        self.min_delay = min_delay
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+        # Circuit breaker: consecutive timeouts and the time it closes again
+        self.timeouts = 0
+        self.open_until = 0.0
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        wait = max(0.0, self.blocked_until - now)
+
+        if self.min_delay <= 0:
+            return wait
+
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed / self.min_delay)
+        self.updated = now
+        self.tokens -= 1
+
+        if self.tokens < 0:
+            wait = max(wait, -self.tokens * self.min_delay)
+        return wait
+
+    def back_off(self, delay: float | None) -> float:
+        if delay is None:
+            delay = min(MAX_BACKOFF, DEFAULT_BACKOFF * 2**self.failures)
+        self.failures += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        return delay
+
+
+class HostScheduler:
+    """
+    Per-host politeness: a minimum delay between requests and a cap on the
+    connections open to the same host. Hosts are independent, so a slow or
+    throttling host never holds back the others. A host that keeps timing
+    out is cut off for a while (circuit breaker), its requests raise
+    HostUnavailable instead of waiting for the timeout again.
+    """
+
+    def __init__(
+        self,
+        min_delay: float = MIN_HOST_DELAY,
+        max_connections: int = MAX_HOST_CONNECTIONS,
+        breaker_timeouts: int = BREAKER_TIMEOUTS,
+        breaker_cooldown: float = BREAKER_COOLDOWN,
+    ) -> None:
+        self.min_delay = min_delay
+        self.max_connections = max_connections
+        self.breaker_timeouts = breaker_timeouts
+        self.breaker_cooldown = breaker_cooldown
+        self._buckets: dict[str, TokenBucket] = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.min_delay)
+        return bucket
+
+    def _reserve(self, host: str) -> float:
+        with self._lock:
+            bucket = self._bucket(host)
+            if time.monotonic() < bucket.open_until:
+                raise HostUnavailable(host)
+            return bucket.reserve()
+
+    def set_delay(self, url: str, delay: float) -> None:
+        """Space the requests to the host by `delay`, e.g. its robots.txt Crawl-delay"""
+        with self._lock:
+            self._bucket(host_of(url)).min_delay = max(
+                self.min_delay, min(delay, MAX_CRAWL_DELAY)
+            )
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Hold one of the host's connections, waiting for its turn first"""
+        host = host_of(url)
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.max_connections)
+
+        async with semaphore:
+            delay = self._reserve(host)
+            if delay:
+                await asyncio.sleep(delay)
+            yield
+
+    def wait(self, url: str, max_wait: float | None = None) -> None:
+        """
+        Blocking version of slot() for the synchronous crawler, sleeping at
+        most max_wait seconds
+        """
+        delay = self._reserve(host_of(url))
+        if max_wait is not None:
+            delay = min(delay, max_wait)
+        if delay:
+            time.sleep(delay)
+
+    def record(self, url: str, status: int, retry_after: str | None = None) -> None:
+        """Back off the host on 429/503, reset its backoff on success"""
+        host = host_of(url)
+        with self._lock:
+            bucket = self._bucket(host)
+
+            if status in BACKOFF_STATUSES:
+                delay = bucket.back_off(parse_retry_after(retry_after))
+                logger.warning(
+                    "%s answered %d, backing off for %.0fs", host, status, delay
+                )
+            elif status < 400:
+                bucket.failures = 0
+            # The host answered, whatever it said
+            bucket.timeouts = 0
+
+    def record_timeout(self, url: str) -> None:
+        """Count a request that timed out, open the breaker once too many did"""
+        host = host_of(url)
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket.timeouts += 1
+            if bucket.timeouts >= self.breaker_timeouts:
+                bucket.open_until = time.monotonic() + self.breaker_cooldown
+                logger.warning(
+                    "%s timed out %d times in a row, skipping it for %.0fs",
+                    host,
+                    bucket.timeouts,
+                    self.breaker_cooldown,
+                )
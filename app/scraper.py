@@ -1,156 +1,382 @@
+import argparse
+import heapq
+import itertools
+import logging
 import re
-from time import sleep
-from urllib.parse import urljoin, urlparse
+import time
+from urllib.parse import urljoin
 
+import deadline
+import errors
+import metrics
+import pagearchive
 import requests
-from bs4 import BeautifulSoup
-from db import get_link_from_db, save_to_db, get_data_status
+from db import (
+    HEARTBEAT_INTERVAL,
+    claim_batches,
+    close_db,
+    default_worker_id,
+    heartbeat,
+    release_claims,
+    save_to_db,
+)
+from discovery import ROBOTS, discover
+from extract import PageScanner, ParsedPage
+from fetcher import (
+    CHUNK_SIZE,
+    MAX_PAGE_BYTES,
+    Response,
+    StreamReader,
+    check_content_type,
+)
+from httpcache import HttpCache
+from matcher import MATCHER, about_score, is_about_url, normalize_text
+from pagearchive import PageArchive
+from pagecache import PageCache
+from politeness import HostScheduler, HostUnavailable
+from requests.adapters import HTTPAdapter
+from urls import canonical_url, is_crawlable, site_key
 
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-REQUEST_DELAY = 0
-HTML_PARSER = "html.parser"
+# Minimum delay between two requests to the same host
+REQUEST_DELAY = 1.0
+POOL_SIZE = 20
+
+# Limits of the crawl of one site looking for about text
+MAX_SITE_PAGES = 20
+MAX_SITE_BYTES = 8 * 1024 * 1024
+MAX_CRAWL_DEPTH = 2
+
+
+def create_session(pool_size: int = POOL_SIZE) -> requests.Session:
+    """Session with keep-alive connection pools shared by the whole crawler"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+SESSION = create_session()
+SCHEDULER = HostScheduler(min_delay=REQUEST_DELAY)
+PAGE_CACHE = PageCache()
+HTTP_CACHE = HttpCache()
+# Fetched pages are archived to ARCHIVE_DIR, None (the default) for no
+# archive, and in replay mode read from it. The archive is opened by
+# scrape_sites, in each crawler process, so that forked workers never write
+# the same segment.
+ARCHIVE_DIR: str | None = None
+ARCHIVE: PageArchive | None = None
+REPLAY = False
+
+logger = logging.getLogger(__name__)
+
+
+def load_by_batch_in_memory(
+    batch_size: int = 10, worker_id: str | None = None, all_companies: bool = False
+):
+    """
+    Yield batches of (ric, web_link) claimed for this worker, so several
+    crawler processes can share the database without doing the same work.
+    """
+    yield from claim_batches(batch_size, worker_id, all_companies)
+
 
-# TODO: if scraped, don't scrape again. If url is empty pass
-# TODO: Add logging properly
+def scan_page(url: str, scanner, max_bytes: int = MAX_PAGE_BYTES) -> Response:
+    """
+    Stream the page into `scanner`, stopping as soon as it is done or after
+    max_bytes. Non-HTML responses raise UnwantedContent unread, and pages
+    seen in a previous run are revalidated against the HTTP cache. Inside
+    deadline.site_deadline(), the request stops once the site's budget is
+    spent and raises DeadlineExceeded. In replay mode the page comes from
+    the archive and nothing is downloaded.
+    """
+    if REPLAY:
+        return ARCHIVE.scan(url, scanner, max_bytes)
+    ROBOTS.check(url, USER_AGENT)
+    deadline.check(url)
+    entry = HTTP_CACHE.lookup(url)
 
+    SCHEDULER.wait(url, max_wait=deadline.remaining())
+    try:
+        with metrics.span("fetch", url=url):
+            response = _scan_page(url, scanner, entry, max_bytes)
+    except requests.RequestException as e:
+        if deadline.expired():
+            raise deadline.DeadlineExceeded(url) from e
+        if errors.classify_error(e) == errors.TIMEOUT:
+            SCHEDULER.record_timeout(url)
+        raise
+
+    if ARCHIVE is not None:
+        ARCHIVE.write(url, response)
+    return response
+
+
+def _scan_page(url: str, scanner, entry, max_bytes: int) -> Response:
+    with SESSION.get(
+        url,
+        headers=HttpCache.conditional_headers(entry),
+        timeout=deadline.timeouts(url),
+        stream=True,
+    ) as response:
+        SCHEDULER.record(url, response.status_code, response.headers.get("Retry-After"))
+        metrics.HTTP_RESPONSES.inc(status=response.status_code)
+
+        if response.status_code == 304 and entry is not None:
+            HTTP_CACHE.revalidated(entry)
+            reader = StreamReader(scanner, entry.encoding, max_bytes)
+            if not reader.feed(entry.body):
+                reader.finish()
+            reader.observe()
+            return Response(
+                url=response.url,
+                status=200,
+                headers=dict(response.headers),
+                body=entry.body,
+                encoding=entry.encoding,
+                from_cache=True,
+            )
 
-def load_by_batch_in_memory(batch_size: int = 10):
-    data = get_link_from_db()
-    for i in range(0, len(data), batch_size):
-        yield data[i : i + batch_size]
+        response.raise_for_status()
+        reader = StreamReader(scanner, response.encoding, max_bytes)
+        check_content_type(response.headers.get("Content-Type"), reader.content_types)
+
+        for chunk in response.iter_content(CHUNK_SIZE):
+            # The read timeout applies per chunk, a slow trickle must stop too
+            deadline.check(url)
+            if reader.feed(chunk):
+                break
+        else:
+            reader.finish()
+        reader.observe()
+
+        if reader.complete:
+            HTTP_CACHE.store(url, response.headers, reader.body, reader.encoding)
+
+        return Response(
+            url=response.url,
+            status=response.status_code,
+            headers=dict(response.headers),
+            body=reader.body,
+            encoding=reader.encoding,
+            truncated=not reader.complete,
+        )
 
 
-def is_about_url(url):
+def fetch_page(url: str) -> tuple[ParsedPage, int]:
     """
-    Return True if the path of the URL contains any of these keywords:
-    "about", "acerca", "sobre", "our".
-    This is a more relaxed check than looking for an exact "/about" path.
+    Return the parsed page and the bytes downloaded for it, 0 if it was
+    already read in this run
     """
-    path = urlparse(url).path.lower()
+    page = PAGE_CACHE.get(url)
+    if page is not None:
+        return page, 0
 
-    # We simply check if any of the keywords is contained anywhere in the path
-    keywords = ["about", "acerca", "sobre", "our", "information", "informacion"]
-    return any(kw in path for kw in keywords)
+    scanner = PageScanner()
+    response = scan_page(url, scanner)
+    page = scanner.page()
+    PAGE_CACHE.put(url, page, len(response.body))
+    return page, len(response.body)
 
 
-def find_about_page(base_url: str) -> str:
-    try:
-        response = requests.get(
-            base_url,
-            headers={"User-Agent": USER_AGENT},
-            timeout=10,
-        )
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, HTML_PARSER)
+def get_page(url: str) -> ParsedPage:
+    """Return the parsed page, downloading it only the first time in the run"""
+    return fetch_page(url)[0]
 
-        for link in soup.find_all("a", href=True):
-            absolute_url = urljoin(base_url, link["href"])
-            if is_about_url(absolute_url):
-                return absolute_url
 
-    except Exception as e:
-        print(f"Error checking homepage: {e}")
-        return "ERROR"
+def _is_about_link(base_url: str, href: str) -> bool:
+    try:
+        return is_about_url(urljoin(base_url, href))
+    except ValueError:
+        # A malformed link, e.g. with a broken IPv6 host
+        return False
 
 
-def add_internal_links_to_queue(url, start_url, queue, depth):
-    """Add internal links to the queue for further crawling"""
+def find_about_page(base_url: str) -> str:
     try:
-        response = requests.get(
-            url,
-            headers={"User-Agent": USER_AGENT},
-            timeout=10,
-        )
-        response.raise_for_status()
+        # Stop downloading the homepage at the first about link
+        scanner = PageScanner(link_filter=lambda href: _is_about_link(base_url, href))
+        response = scan_page(base_url, scanner)
+
+        if scanner.found_link is not None:
+            return urljoin(base_url, scanner.found_link)
+
+        # The whole homepage was read, keep it for the deeper crawl
+        PAGE_CACHE.put(base_url, scanner.page(), len(response.body))
 
-        soup = BeautifulSoup(response.text, HTML_PARSER)
-        for link in soup.find_all("a", href=True):
-            absolute_url = urljoin(url, link["href"])
-            parsed = urlparse(absolute_url)
-            if parsed.netloc == urlparse(start_url).netloc:
-                queue.append((absolute_url, depth + 1))
     except Exception as e:
-        print(f"Error adding links from {url}: {e}")
+        logger.error("Error checking homepage %s: %s", base_url, e)
+        errors.record(e)
         return "ERROR"
 
 
+def has_about_text(page: ParsedPage) -> bool:
+    with metrics.span("match"):
+        return MATCHER.contains(normalize_text(page.text), "about_text")
+
+
 def check_about_text(url: str) -> bool:
     """Check if the page contains about text"""
     try:
-        response = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=10)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.text, HTML_PARSER)
-        text = soup.get_text().lower()
-        if any(
-            kw in text for kw in ["about us", "acerca de", "quiénes somos", "sobre"]
-        ):
-            return True
+        return has_about_text(get_page(url))
     except Exception as e:
-        print(f"Error checking {url}: {e}")
+        logger.error("Error checking %s: %s", url, e)
     return False
 
 
-def extract_site_info(base_url: str) -> str:
-    """Crawl site to find first page containing about text"""
-    visited = set()
-    queue = [(base_url, 0)]
-
-    while queue:
-        url, depth = queue.pop(0)
-
-        if url in visited or depth > 1:
+def extract_site_info(
+    base_url: str,
+    max_pages: int = MAX_SITE_PAGES,
+    max_bytes: int = MAX_SITE_BYTES,
+) -> str:
+    """
+    Crawl site to find first page containing about text.
+    The most about-like links (path and anchor text) are visited first,
+    each page once whatever the spelling of its URL, until the site's page
+    or byte budget is spent.
+    """
+    site = site_key(base_url)
+    seen = {canonical_url(base_url)}
+    order = itertools.count()
+    # (-score, discovery order, url, depth)
+    frontier = [(0.0, next(order), base_url, 0)]
+    pages = downloaded = 0
+
+    while frontier and pages < max_pages and downloaded < max_bytes:
+        _, _, url, depth = heapq.heappop(frontier)
+
+        try:
+            page, size = fetch_page(url)
+        except (deadline.DeadlineExceeded, HostUnavailable) as e:
+            # Every page left is on the same host, within the same budget
+            logger.warning("Giving up on %s: %r", base_url, e)
+            errors.record(e)
+            return "ERROR"
+        except Exception as e:
+            logger.error("Error checking %s: %s", url, e)
             continue
+        pages += 1
+        downloaded += size
 
-        visited.add(url)
-
-        if check_about_text(url):
+        if has_about_text(page):
             return url
 
-        if depth < 1:
-            add_internal_links_to_queue(url, base_url, queue, depth)
+        if depth >= MAX_CRAWL_DEPTH:
+            continue
 
-        # sleep(REQUEST_DELAY)
+        for href, anchor in page.links:
+            try:
+                link = urljoin(url, href)
+            except ValueError:
+                continue
+            # Malformed links, e.g. with a bad port, are not crawlable
+            if not is_crawlable(link):
+                continue
+            key = canonical_url(link)
+            if key in seen or site_key(link) != site:
+                continue
+            seen.add(key)
+            heapq.heappush(
+                frontier, (-about_score(link, anchor), next(order), link, depth + 1)
+            )
 
     return "EMPTY"
 
 
-def check_if_scraped(url: str) -> bool:
-    return get_data_status(url) == "SCRAPED"
-
+def scrape(url: str, site_deadline: float | None = deadline.SITE_DEADLINE) -> None:
+    with (
+        metrics.site(url),
+        errors.capture() as failure,
+        deadline.site_deadline(site_deadline),
+    ):
+        # The sitemap may list the about page, then the homepage is not parsed
+        # unless none of its candidates can be read or has about text
+        candidates = discover(scan_page, url, SCHEDULER, USER_AGENT)
+        about_page = next(
+            (page for page in candidates if check_about_text(page)), None
+        ) or find_about_page(url)
 
-def scrape(url: str) -> None:
-    # Scrape the site
-    about_page = find_about_page(url)
+        if not about_page:
+            # If no direct about page found, try deeper scanning
+            about_page = extract_site_info(url)
 
-    if not about_page:
-        # If no direct about page found, try deeper scanning
-        about_page = extract_site_info(url)
+        if about_page == "EMPTY":
+            status = "EMPTY"
+        elif about_page == "ERROR":
+            status = "ERROR"
+        else:
+            status = "SCRAPED"
 
-    if about_page == "EMPTY":
-        status = "EMPTY"
-    elif about_page == "ERROR":
-        status = "ERROR"
-    else:
-        status = "SCRAPED"
+        # Save your result to the database
+        save_to_db(url, about_page, status=status, error_class=failure.error_class)
 
-    # Save your result to the database
-    save_to_db(url, about_page, status=status)
+    logger.info("About page for %s found in: %s", url, about_page)
 
-    print(f"About page for {url} found in: {about_page}")
 
+def use_archive(path: str | None, replay: bool = False) -> None:
+    """Archive the fetched pages to `path`, or with `replay` read them from it"""
+    global ARCHIVE_DIR, REPLAY
+    ARCHIVE_DIR, REPLAY = path, replay
 
-def scrape_sites(batch_size: int = 10) -> None:
-    for chunk in load_by_batch_in_memory(batch_size=batch_size):
-        for url in chunk:
-            url = url[0]
 
-            if check_if_scraped(url):
-                print(f"Already scraped: {url}")
-                continue
+def scrape_sites(
+    batch_size: int = 10,
+    worker_id: str | None = None,
+    site_deadline: float | None = deadline.SITE_DEADLINE,
+) -> None:
+    """
+    Crawl the pending companies, or in replay mode every company again
+    from the archive
+    """
+    global ARCHIVE
+    worker_id = worker_id or default_worker_id()
+    last_heartbeat = time.monotonic()
+    ARCHIVE = PageArchive(ARCHIVE_DIR) if ARCHIVE_DIR is not None else None
 
-            scrape(url)
+    try:
+        for chunk in load_by_batch_in_memory(batch_size, worker_id, REPLAY):
+            for ric, url in chunk:
+                try:
+                    with pagearchive.company(ric):
+                        scrape(url, site_deadline)
+                except Exception as e:
+                    # One site must not stop the crawl, nor be claimed again
+                    # and fail the same way in every run
+                    logger.error("Error scraping %s: %s", url, e)
+                    save_to_db(url, "", "ERROR", errors.classify_error(e))
+
+                if time.monotonic() - last_heartbeat > HEARTBEAT_INTERVAL:
+                    heartbeat(worker_id)
+                    last_heartbeat = time.monotonic()
+    finally:
+        release_claims(worker_id)
+        if ARCHIVE is not None:
+            ARCHIVE.close()
+
+    logger.info("Page cache: %s", PAGE_CACHE.stats())
+    logger.info("HTTP cache: %s", HTTP_CACHE.stats())
+    if ARCHIVE is not None:
+        logger.info("Archive: %s", ARCHIVE.stats())
+    HTTP_CACHE.close()
+    close_db()
 
 
 if __name__ == "__main__":
-    scrape_sites(batch_size=5)  # Call the scrape function with batch_size
+    parser = argparse.ArgumentParser(
+        description="Find the about page of the companies."
+    )
+    parser.add_argument(
+        "--site-deadline",
+        type=float,
+        default=deadline.SITE_DEADLINE,
+        help="Seconds allowed for the crawl of one site, 0 for no limit",
+    )
+    pagearchive.add_arguments(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.setup(args)
+    use_archive(pagearchive.directory(args), args.replay)
+    # Call the scrape function with batch_size
+    scrape_sites(batch_size=5, site_deadline=args.site_deadline)
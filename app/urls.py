@@ -0,0 +1,92 @@
+import posixpath
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+# Query parameters that never change the page
+TRACKING_PARAMS = {
+    "gclid",
+    "fbclid",
+    "msclkid",
+    "ref",
+    "sessionid",
+    "sid",
+    "phpsessid",
+    "jsessionid",
+}
+TRACKING_PREFIXES = ("utm_",)
+
+# Links to files the crawlers can't read
+SKIPPED_EXTENSIONS = set(
+    """
+    .7z .avi .css .csv .doc .docx .exe .gif .gz .ico .jpeg .jpg .js .json .mov
+    .mp3 .mp4 .pdf .png .ppt .pptx .rar .svg .tar .tgz .webp .xls .xlsx .xml .zip
+    """.split()
+)
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a URL so that trivially different spellings of the same page
+    share a key: lowercase scheme and host, no default port, no fragment.
+    Raise ValueError if the URL can't be parsed, see is_valid_url().
+    """
+    parsed = urlparse(url.strip())
+    scheme = (parsed.scheme or "http").lower()
+    host = (parsed.hostname or "").lower()
+
+    netloc = host
+    if parsed.port and str(parsed.port) != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parsed.port}"
+
+    return urlunparse((scheme, netloc, parsed.path or "/", "", parsed.query, ""))
+
+
+def is_valid_url(url: str) -> bool:
+    """False for a URL that can't be parsed, e.g. with a bad port or IPv6 host"""
+    try:
+        normalize_url(url)
+    except ValueError:
+        return False
+    return True
+
+
+def site_key(url: str) -> str:
+    """Host of the URL without a leading www., the same for the whole site"""
+    host = (urlparse(url.strip()).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def canonical_url(url: str) -> str:
+    """
+    Key under which the crawl visits a page once. On top of normalize_url:
+    no scheme (http and https serve the same page), no www., no trailing
+    slash, no tracking parameters and the query parameters sorted.
+    """
+    parsed = urlparse(normalize_url(url))
+    path = parsed.path.rstrip("/") or "/"
+    query = urlencode(
+        sorted(
+            (name, value)
+            for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+            if name.lower() not in TRACKING_PARAMS
+            and not name.lower().startswith(TRACKING_PREFIXES)
+        )
+    )
+    key = site_key(url)
+    if parsed.port:
+        key = f"{key}:{parsed.port}"
+    return f"{key}{path}?{query}" if query else f"{key}{path}"
+
+
+def is_crawlable(url: str) -> bool:
+    """
+    A valid http(s) link that does not point to a file like a PDF or an
+    image
+    """
+    if not is_valid_url(url):
+        return False
+    parsed = urlparse(url)
+    if parsed.scheme not in DEFAULT_PORTS:
+        return False
+    return posixpath.splitext(parsed.path)[1].lower() not in SKIPPED_EXTENSIONS
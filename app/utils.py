@@ -1,5 +1,32 @@
-import pandas as pd
+from openpyxl import load_workbook
 
+# Identifier (RIC), Company Name, GICS Industry Name, Web Link to Home Page
+XLSX_COLUMNS = 4
+
+
+def read_xlsx(file: str) -> list:
+    import pandas as pd
 
-def read_xlsx(file: str) -> pd.DataFrame:
     return list(pd.read_excel(file).itertuples(index=False, name=None))
+
+
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip()
+    return value
+
+
+def iter_xlsx_rows(file: str):
+    """
+    Stream the rows of the first sheet as (ric, name, industry, link) tuples.
+    The workbook is opened read-only, so memory stays flat whatever its size.
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(min_row=2, values_only=True)
+        for row in rows:
+            row = tuple(_clean(value) for value in row[:XLSX_COLUMNS])
+            if row and row[0]:
+                yield row + (None,) * (XLSX_COLUMNS - len(row))
+    finally:
+        workbook.close()
@@ -0,0 +1,222 @@
+"""
+Crawl a synthetic corporate web with the sync and the async crawler and
+report their throughput, so performance changes can be compared offline.
+
+    python benchmarks/bench_crawl.py --sites 2000 --crawlers scraper final
+
+Each crawler runs in its own process, from a temporary directory holding
+its database and caches, against a fresh synthetic server (see
+synthetic.py). The LLM calls of the async crawler go to the server's fake
+chat completions API.
+"""
+
+import argparse
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+
+from synthetic import CONTROL_HOST, serve, site_url
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP = os.path.join(ROOT, "app")
+PROMPTS = ("prompt.txt", "prompt_batch.txt")
+
+
+def load_companies(sites: int, port: int) -> None:
+    from db import DATABASE_PATH, create_db_and_table, upsert_companies
+
+    create_db_and_table()
+    rows = [
+        (f"BENCH{i}.X", f"Company {i}", "Benchmark", site_url(i, port))
+        for i in range(sites)
+    ]
+    conn = sqlite3.connect(DATABASE_PATH)
+    upsert_companies(rows, conn)
+    conn.close()
+
+
+def timed(function, latencies: list):
+    """Wrap the per-site function of a crawler to record its duration"""
+    if inspect.iscoroutinefunction(function):
+
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    else:
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    return wrapper
+
+
+def run_crawler(name: str, sites: int, port: int, options: dict, results) -> None:
+    """Crawl every site with the `name` crawler, in a temporary directory"""
+    workdir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    os.chdir(workdir)
+    os.makedirs("data")
+    for prompt in PROMPTS:
+        shutil.copy(os.path.join(ROOT, prompt), prompt)
+
+    # Read by enrich at import time
+    os.environ["LLM_BASE_URL"] = f"http://{CONTROL_HOST}:{port}"
+    os.environ["LLM_API_KEY"] = "bench"
+    sys.path.insert(0, APP)
+    logging.disable(logging.CRITICAL)
+
+    load_companies(sites, port)
+
+    import db
+
+    latencies: list[float] = []
+    start = time.perf_counter()
+    if name == "scraper":
+        import scraper
+
+        scraper.scrape = timed(scraper.scrape, latencies)
+        scraper.scrape_sites(batch_size=options["batch_size"])
+    else:
+        import final
+
+        final.scrape_company = timed(final.scrape_company, latencies)
+        final.scrape_sites(
+            batch_size=options["batch_size"],
+            concurrency=options["concurrency"],
+            parse_workers=options["parse_workers"],
+        )
+    elapsed = time.perf_counter() - start
+
+    results.put(
+        {
+            "crawler": name,
+            "elapsed": elapsed,
+            "latencies": latencies,
+            "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "children_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            / 1024,
+            "db_write_seconds": db.STORE.flush_seconds,
+            "db_rows": db.STORE.rows_written,
+            "db_flushes": db.STORE.flushes,
+        }
+    )
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def server_stats(port: int) -> dict:
+    with urllib.request.urlopen(f"http://{CONTROL_HOST}:{port}/__stats") as response:
+        return json.load(response)
+
+
+def bench(name: str, args) -> dict:
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    server = context.Process(
+        target=serve, args=(args.sites, args.seed, 0, ready), daemon=True
+    )
+    server.start()
+    port = ready.get(timeout=30)
+
+    results = context.Queue()
+    options = {
+        "batch_size": args.batch_size,
+        "concurrency": args.concurrency,
+        "parse_workers": args.parse_workers,
+    }
+    crawler = context.Process(
+        target=run_crawler, args=(name, args.sites, port, options, results)
+    )
+    crawler.start()
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not crawler.is_alive():
+                server.terminate()
+                sys.exit(f"{name} crashed with exit code {crawler.exitcode}")
+    crawler.join()
+
+    result.update(server_stats(port))
+    server.terminate()
+    server.join()
+    return result
+
+
+def report(result: dict) -> None:
+    latencies = result["latencies"]
+    sites = len(latencies)
+    percentiles = (
+        statistics.quantiles(latencies, n=100, method="inclusive")
+        if sites > 1
+        else [latencies[0] if latencies else 0.0] * 99
+    )
+    print(f"\n{result['crawler']}")
+    print(f"  sites               {sites}")
+    print(f"  elapsed             {result['elapsed']:.2f}s")
+    print(f"  sites/s             {sites / result['elapsed']:.2f}")
+    print(f"  pages/site          {result['pages'] / max(sites, 1):.2f}")
+    print(f"  MB/site             {result['bytes'] / max(sites, 1) / 1024 / 1024:.3f}")
+    print(
+        f"  site latency        p50 {percentiles[49]:.3f}s  "
+        f"p95 {percentiles[94]:.3f}s  p99 {percentiles[98]:.3f}s"
+    )
+    print(
+        f"  peak RSS            {result['rss_mb']:.1f} MB"
+        f" (child processes {result['children_rss_mb']:.1f} MB)"
+    )
+    print(
+        f"  DB writes           {result['db_write_seconds']:.3f}s for "
+        f"{result['db_rows']} rows in {result['db_flushes']} flushes"
+    )
+    if result["llm_requests"]:
+        print(f"  LLM requests        {result['llm_requests']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sites", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--crawlers",
+        nargs="+",
+        choices=["scraper", "final"],
+        default=["scraper", "final"],
+    )
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.crawlers:
+        result = bench(name, args)
+        report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
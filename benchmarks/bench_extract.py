@@ -0,0 +1,87 @@
+"""
+Compare the extraction of links and text by BeautifulSoup, as the crawlers
+used to do it, with extract.parse_page on a directory of saved pages.
+
+    python benchmarks/bench_extract.py path/to/pages --repeat 5
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from extract import parse_page
+
+
+def with_beautifulsoup(html: str, parser: str) -> tuple[int, int]:
+    soup = BeautifulSoup(html, parser)
+    links = [(a["href"], a.get_text()) for a in soup.find_all("a", href=True)]
+    return len(links), len(soup.get_text())
+
+
+def with_extract(html: str) -> tuple[int, int]:
+    page = parse_page(html)
+    return len(page.links), len(page.text)
+
+
+def load_pages(directory: str) -> list[str]:
+    pages = []
+    for path in sorted(Path(directory).rglob("*.htm*")):
+        pages.append(path.read_text(encoding="utf-8", errors="replace"))
+    return pages
+
+
+def bench(name: str, fn, pages: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in pages:
+            fn(html)
+        best = min(best, time.perf_counter() - start)
+
+    size = sum(len(html) for html in pages) / 1024 / 1024
+    print(
+        f"{name:<24} {best:8.3f}s  {len(pages) / best:8.1f} pages/s  "
+        f"{size / best:6.1f} MB/s"
+    )
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pages", help="Directory with saved .html pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    if not pages:
+        sys.exit(f"No .html files found in {args.pages}")
+    print(f"{len(pages)} pages, best of {args.repeat} runs")
+
+    baseline = bench(
+        "BeautifulSoup html.parser",
+        lambda html: with_beautifulsoup(html, "html.parser"),
+        pages,
+        args.repeat,
+    )
+    try:
+        bench(
+            "BeautifulSoup lxml",
+            lambda html: with_beautifulsoup(html, "lxml"),
+            pages,
+            args.repeat,
+        )
+    except Exception as e:
+        print(f"BeautifulSoup lxml       skipped: {e}")
+
+    best = bench("extract.parse_page", with_extract, pages, args.repeat)
+    print(f"Speedup over html.parser: {baseline / best:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
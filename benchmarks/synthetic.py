@@ -0,0 +1,281 @@
+"""
+Synthetic corporate web for the crawl benchmark. Every site is served from
+its own loopback address (127.1.x.y), all by one threaded HTTP server that
+tells them apart by the Host header. 127.0.0.1 answers the benchmark's
+own endpoints and an OpenAI-compatible chat completions API.
+
+    python benchmarks/synthetic.py --sites 100 --port 8080
+"""
+
+import argparse
+import ipaddress
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIRST_SITE_ADDRESS = ipaddress.IPv4Address("127.1.0.1")
+CONTROL_HOST = "127.0.0.1"
+
+# Share of each kind of site, see Site
+SITE_KINDS = {
+    "about_en": 30,
+    "about_es": 20,
+    "deep": 10,
+    "no_about": 10,
+    "large": 8,
+    "redirect": 8,
+    "slow": 8,
+    "error": 6,
+}
+LARGE_PAGE_BYTES = 3 * 1024 * 1024
+SLOW_DELAY = (0.5, 2.0)
+LLM_DELAY = 0.2
+
+WORDS = """
+    solutions quality service customers global industry value products growth
+    innovation team market leading partners technology energy financial health
+    people community sustainable experience results trusted worldwide
+    """.split()
+ABOUT_PATHS = {
+    "en": ["/about-us", "/about", "/who-we-are", "/company/about"],
+    "es": ["/quienes-somos", "/sobre-nosotros", "/acerca-de", "/nosotros"],
+}
+PURPOSES = {
+    "en": "Our purpose is to {} {} for every {}.",
+    "es": "Nuestro propósito es ofrecer {} {} para cada {}.",
+}
+ABOUT_TITLES = {"en": "About us", "es": "Quiénes somos"}
+
+
+def site_host(index: int) -> str:
+    return str(FIRST_SITE_ADDRESS + index)
+
+
+def site_index(host: str) -> int | None:
+    try:
+        return int(ipaddress.IPv4Address(host)) - int(FIRST_SITE_ADDRESS)
+    except ValueError:
+        return None
+
+
+def site_url(index: int, port: int) -> str:
+    return f"http://{site_host(index)}:{port}"
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def _paragraphs(rng: random.Random, count: int) -> str:
+    return "".join(
+        f"<p>{_words(rng, rng.randint(20, 60)).capitalize()}.</p>" for _ in range(count)
+    )
+
+
+class Site:
+    """
+    One generated company site, the same for a given seed and index.
+    Kinds: about page linked from the home page in English or Spanish, about
+    text only on a page one level down ("deep"), no about page at all, a
+    home page of several MB with the about link at the end ("large"), a
+    home page behind a redirect, slow pages, and a failing home page.
+    """
+
+    def __init__(self, index: int, seed: int) -> None:
+        rng = random.Random(f"{seed}-{index}")
+        self.index = index
+        self.kind = rng.choices(list(SITE_KINDS), weights=SITE_KINDS.values())[0]
+        self.language = {"about_en": "en", "about_es": "es"}.get(
+            self.kind, rng.choice(["en", "es"])
+        )
+        self.about_path = rng.choice(ABOUT_PATHS[self.language])
+        self.has_purpose = rng.random() < 0.7
+        self.delay = rng.uniform(*SLOW_DELAY) if self.kind == "slow" else 0.0
+        self.error_status = rng.choice([404, 500, 503])
+        self.sections = [
+            f"/{rng.choice(['products', 'news', 'services', 'careers'])}/{n}"
+            for n in range(rng.randint(5, 40))
+        ]
+        self.seed = f"{seed}-{index}"
+
+    def _layout(self, rng: random.Random, body: str, about_link: bool) -> str:
+        links = [
+            f'<li><a href="{path}">{_words(rng, 2)}</a></li>' for path in self.sections
+        ]
+        if about_link:
+            title = ABOUT_TITLES[self.language]
+            links.append(f'<li><a href="{self.about_path}">{title}</a></li>')
+        links.append('<li><a href="/brochure.pdf">Brochure</a></li>')
+        links.append('<li><a href="https://example.com/partner">Partner</a></li>')
+        return (
+            "<!DOCTYPE html><html><head><title>Company</title>"
+            "<style>body { font-family: sans-serif; }</style>"
+            "<script>var tracking = {enabled: true};</script></head><body>"
+            f"<nav><ul>{''.join(links)}</ul></nav><main>{body}</main>"
+            "<footer><p>Copyright 2024, all rights reserved. Cookie policy.</p></footer>"
+            "</body></html>"
+        )
+
+    def _about(self, rng: random.Random) -> str:
+        body = f"<h1>{ABOUT_TITLES[self.language]}</h1>" + _paragraphs(rng, 3)
+        if self.has_purpose:
+            purpose = PURPOSES[self.language].format(*rng.sample(WORDS, 3))
+            body += f"<h2>Purpose</h2><p>{purpose}</p>"
+        return body + _paragraphs(rng, 2)
+
+    def page(self, path: str) -> tuple[int, dict, bytes]:
+        """Status, headers and body for a path of the site"""
+        rng = random.Random(f"{self.seed}-{path}")
+        headers = {"Content-Type": "text/html; charset=utf-8"}
+
+        if path == "/" and self.kind == "error":
+            return self.error_status, headers, b"<html><body>Error</body></html>"
+        if path == "/" and self.kind == "redirect":
+            return 301, {"Location": "/home"}, b""
+        if path.endswith(".pdf"):
+            return 200, {"Content-Type": "application/pdf"}, b"%PDF-1.4" + b"\0" * 4096
+
+        linked_about = self.kind not in ("deep", "no_about")
+        if path in ("/", "/home"):
+            body = _paragraphs(rng, 5)
+            if self.kind == "large":
+                filler = _paragraphs(rng, 50)
+                body += filler * (LARGE_PAGE_BYTES // len(filler) + 1)
+            html = self._layout(rng, body, linked_about)
+        elif path == self.about_path and linked_about:
+            html = self._layout(rng, self._about(rng), linked_about)
+        elif self.kind == "deep" and path == self.sections[0]:
+            html = self._layout(rng, self._about(rng), False)
+        elif path in self.sections:
+            html = self._layout(rng, _paragraphs(rng, 4), linked_about)
+        else:
+            return 404, headers, b"<html><body>Not found</body></html>"
+        return 200, headers, html.encode("utf-8")
+
+
+def fake_completion(prompt: str) -> str:
+    """A valid answer to the single or the batch prompt"""
+    found = re.search(r"(our purpose is|nuestro proposito es)[^.]*", prompt.lower())
+    result = {
+        "purpose": found.group(0) if found else "EMPTY",
+        "paragraph": found.group(0) if found else "EMPTY",
+        "confidence": 8 if found else 2,
+        "overview": "EMPTY",
+        "focus": "EMPTY",
+        "inference": "EMPTY" if found else "To serve its customers",
+    }
+    rics = re.findall(r"^RIC: (\S+)", prompt, re.MULTILINE)
+    if rics:
+        return json.dumps([{"ric": ric, **result} for ric in rics])
+    return json.dumps(result)
+
+
+class SyntheticWeb(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, sites: int, seed: int) -> None:
+        super().__init__(address, Handler)
+        self.sites = sites
+        self.seed = seed
+        self.stats = {"pages": 0, "bytes": 0, "llm_requests": 0}
+        self._lock = threading.Lock()
+        self._cache: dict[int, Site] = {}
+
+    def site(self, index: int) -> Site:
+        if index not in self._cache:
+            self._cache[index] = Site(index, self.seed)
+        return self._cache[index]
+
+    def count(self, **increments) -> None:
+        with self._lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, headers: dict, body: bytes) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        host = (self.headers.get("Host") or "").rsplit(":", 1)[0]
+        path = self.path.split("?")[0].split("#")[0]
+
+        if host == CONTROL_HOST and path == "/__stats":
+            body = json.dumps(self.server.stats).encode()
+            return self._send(200, {"Content-Type": "application/json"}, body)
+
+        index = site_index(host)
+        if index is None or not 0 <= index < self.server.sites:
+            return self._send(404, {}, b"")
+
+        site = self.server.site(index)
+        if site.delay:
+            time.sleep(site.delay)
+        status, headers, body = site.page(path)
+        self.server.count(pages=1, bytes=len(body))
+        try:
+            self._send(status, headers, body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The crawlers stop reading large pages early
+            self.close_connection = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            return self._send(404, {}, b"")
+
+        time.sleep(LLM_DELAY)
+        self.server.count(llm_requests=1)
+        prompt = request["messages"][-1]["content"]
+        body = {
+            "id": "bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "bench"),
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": fake_completion(prompt),
+                    },
+                }
+            ],
+        }
+        self._send(200, {"Content-Type": "application/json"}, json.dumps(body).encode())
+
+
+def serve(sites: int, seed: int, port: int = 0, ready=None) -> None:
+    """Serve until killed, sending the bound port to `ready` if given"""
+    # Bound to every interface since a socket bound to 127.0.0.1 would not
+    # receive the connections to the other loopback addresses
+    server = SyntheticWeb(("0.0.0.0", port), sites, seed)
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sites", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    print(f"Serving {args.sites} sites from {site_host(0)} on port {args.port}")
+    serve(args.sites, args.seed, args.port)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The crawler modules import each other by name from app/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "app"))
@@ -0,0 +1,79 @@
+import multiprocessing
+import sqlite3
+
+import db
+
+COMPANIES = 400
+
+
+def _crawl(path: str, worker_id: str, results) -> None:
+    """Claim sites until none is left and save each, like a crawler process"""
+    db.STORE = db.WriteBehindStore(path)
+    claimed = []
+    for batch in db.claim_batches(7, worker_id):
+        for ric, url in batch:
+            claimed.append(ric)
+            db.save_to_db(url, "http://about", status="SCRAPED")
+        db.flush_db()
+    db.release_claims(worker_id)
+    db.close_db()
+    results.put(claimed)
+
+
+def _fill(path: str) -> None:
+    db.create_db_and_table(path)
+    conn = sqlite3.connect(path)
+    # Every site is listed twice, e.g. two share classes of one company
+    rows = [
+        (f"R{i:04d}", f"Company {i}", "Industry", f"http://site{i // 2}.com/")
+        for i in range(COMPANIES)
+    ]
+    # And some have no link at all
+    rows += [(f"X{i:04d}", f"Unlisted {i}", "Industry", "EMPTY") for i in range(10)]
+    db.upsert_companies(rows, conn)
+    conn.close()
+
+
+def test_processes_claim_every_site_once(tmp_path):
+    path = str(tmp_path / "database.db")
+    _fill(path)
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [
+        context.Process(target=_crawl, args=(path, f"worker-{n}", results))
+        for n in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    claimed = [ric for _ in workers for ric in results.get(timeout=60)]
+    for worker in workers:
+        worker.join(timeout=60)
+
+    assert len(claimed) == len(set(claimed)) == COMPANIES // 2
+    assert all(int(ric[1:]) % 2 == 0 for ric in claimed)
+
+    conn = sqlite3.connect(path)
+    statuses = dict(
+        conn.execute("SELECT ric, status FROM companies WHERE ric LIKE 'R%'")
+    )
+    leases = conn.execute(
+        "SELECT COUNT(*) FROM companies WHERE claimed_by IS NOT NULL"
+    ).fetchone()[0]
+    conn.close()
+    assert set(statuses.values()) == {"SCRAPED"}
+    assert leases == 0
+
+
+def test_claim_skips_sites_held_by_another_worker(tmp_path, monkeypatch):
+    path = str(tmp_path / "database.db")
+    _fill(path)
+    monkeypatch.setattr(db, "STORE", db.WriteBehindStore(path))
+    try:
+        first = db.claim_companies("a", 3, run_started=0)
+        second = db.claim_companies("b", 3, run_started=0)
+    finally:
+        db.close_db()
+
+    assert [ric for ric, _ in first] == ["R0000", "R0002", "R0004"]
+    assert [ric for ric, _ in second] == ["R0006", "R0008", "R0010"]
@@ -0,0 +1,26 @@
+import discovery
+from discovery import discover
+
+ROBOTS = b"Sitemap: http://x.com/sitemap.xml\nSitemap: http://[::1/sitemap.xml\n"
+
+SITEMAP = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>http://x.com:80a/about</loc></url>
+  <url><loc>http://[::1/about</loc></url>
+  <url><loc>http://x.com/about-us</loc></url>
+  <url><loc>http://x.com/products</loc></url>
+</urlset>
+"""
+
+
+def test_unparseable_sitemap_urls_are_left_out(monkeypatch):
+    monkeypatch.setattr(discovery, "ROBOTS", discovery.RobotsCache())
+    scanned = []
+
+    def scan(url, scanner, max_bytes):
+        scanned.append(url)
+        scanner.feed(ROBOTS if url.endswith("/robots.txt") else SITEMAP)
+        scanner.close()
+
+    assert discover(scan, "http://x.com/") == ["http://x.com/about-us"]
+    assert scanned == ["http://x.com/robots.txt", "http://x.com/sitemap.xml"]
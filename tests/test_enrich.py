@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+
+import enrich
+import pytest
+from aiohttp import web
+from enrich import Enricher, EnrichmentJob, parse_llm_result
+from llmcache import LLMCache
+from openai import AsyncOpenAI
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+
+RESULT = {
+    "purpose": "Makes widgets",
+    "paragraph": "We make widgets for everyone.",
+    "confidence": "9",
+    "overview": "A widget maker",
+    "focus": ["widgets", "gadgets"],
+    "inference": "Stated on the about page",
+}
+
+
+def completion(content: str) -> dict:
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": enrich.LLM_MODEL,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+    }
+
+
+class FakeLLM:
+    """OpenAI-compatible server answering with the scripted replies in order"""
+
+    def __init__(self, replies: list) -> None:
+        self.replies = list(replies)
+        self.requests = []
+
+    async def chat(self, request: web.Request) -> web.Response:
+        self.requests.append(await request.json())
+        reply = self.replies.pop(0)
+        if isinstance(reply, int):
+            return web.json_response({"error": {"message": "busy"}}, status=reply)
+        return web.json_response(completion(reply))
+
+
+@asynccontextmanager
+async def fake_llm(replies: list):
+    """The FakeLLM server and an OpenAI client connected to it"""
+    server = FakeLLM(replies)
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", server.chat)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    port = runner.addresses[0][1]
+
+    client = AsyncOpenAI(
+        api_key="test", base_url=f"http://127.0.0.1:{port}/v1", max_retries=0
+    )
+    try:
+        yield server, client
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+async def enrich_with(replies: list, retries: int = 2):
+    async with fake_llm(replies) as (server, client):
+        enricher = Enricher(requests_per_minute=None, retries=retries, client=client)
+        result = await enricher.enrich("http://widgets.com", "We make widgets.")
+    return result, enricher, server
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # prompt.txt is read relative to the working directory
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(enrich, "RETRY_BACKOFF", 0)
+
+
+def test_enrich_parses_the_answer():
+    answer = f"Here you go:\n```json\n{json.dumps(RESULT)}\n```"
+    result, enricher, server = asyncio.run(enrich_with([answer]))
+
+    assert result == parse_llm_result(json.dumps(RESULT))
+    assert result["confidence"] == 9
+    assert result["focus"] == "widgets, gadgets"
+    assert enricher.retried == 0
+    assert "http://widgets.com" in server.requests[0]["messages"][1]["content"]
+
+
+def test_enrich_retries_a_malformed_answer():
+    replies = ['{"purpose": "Makes widgets",', json.dumps(RESULT)]
+    result, enricher, server = asyncio.run(enrich_with(replies))
+
+    assert result["purpose"] == "Makes widgets"
+    assert enricher.retried == 1
+    assert len(server.requests) == 2
+
+
+def test_enrich_retries_server_errors_then_gives_up():
+    result, enricher, server = asyncio.run(enrich_with([500, 503, 500], retries=2))
+
+    assert result is None
+    assert enricher.retried == 2
+    assert not server.replies
+
+
+def test_missing_api_key_fails_clearly(monkeypatch):
+    monkeypatch.setattr(enrich, "LLM_API_KEY", None)
+    with pytest.raises(RuntimeError, match="LLM_API_KEY"):
+        Enricher()
+
+
+def test_cached_results_are_kept_apart_by_site(tmp_path):
+    parked = "This domain is for sale."
+    other = {**RESULT, "inference": "Another company"}
+
+    async def run():
+        async with fake_llm([json.dumps(RESULT), json.dumps(other)]) as (
+            server,
+            client,
+        ):
+            cache = LLMCache(str(tmp_path / "llm_cache.db"))
+            enricher = Enricher(requests_per_minute=None, client=client, cache=cache)
+            results = [
+                await enricher.enrich("http://a.com", parked),
+                await enricher.enrich("http://b.com", parked),
+                # Another spelling of the first company's link
+                await enricher.enrich("https://www.a.com/", parked),
+            ]
+            cache.close()
+        return results, server
+
+    (first, second, again), server = asyncio.run(run())
+
+    assert first["inference"] == RESULT["inference"]
+    assert second["inference"] == "Another company"
+    assert again == first
+    assert len(server.requests) == 2
+
+
+def test_batch_results_are_matched_by_ric_and_the_rest_sent_alone(monkeypatch):
+    saved = []
+    monkeypatch.setattr(
+        enrich, "update_purpose", lambda url, **result: saved.append((url, result))
+    )
+    jobs = [
+        EnrichmentJob("A.N", "http://a.com", "We make widgets."),
+        EnrichmentJob("B.N", "http://b.com", "We make gadgets."),
+        EnrichmentJob("C.N", "http://c.com", "We make gizmos."),
+    ]
+    gadgets = {**RESULT, "purpose": "Makes gadgets"}
+    gizmos = {**RESULT, "purpose": "Makes gizmos"}
+    batch = [
+        # Out of order, one item invalid and C.N missing
+        {"ric": "B.N", "purpose": "Makes gadgets"},
+        {**RESULT, "ric": "A.N"},
+    ]
+    replies = [json.dumps(batch), json.dumps(gadgets), json.dumps(gizmos)]
+
+    async def run():
+        async with fake_llm(replies) as (server, client):
+            enricher = Enricher(requests_per_minute=None, client=client, batch_tokens=1)
+            await enricher._process(jobs)
+        return enricher, server
+
+    enricher, server = asyncio.run(run())
+
+    prompts = [request["messages"][1]["content"] for request in server.requests]
+    assert all(f"RIC: {job.ric}" in prompts[0] for job in jobs)
+    assert "http://b.com" in prompts[1]
+    assert "http://c.com" in prompts[2]
+    assert saved == [
+        ("http://a.com", parse_llm_result(json.dumps(RESULT))),
+        ("http://b.com", parse_llm_result(json.dumps(gadgets))),
+        ("http://c.com", parse_llm_result(json.dumps(gizmos))),
+    ]
+    assert enricher.enriched == 3
+    assert enricher.retried == 0
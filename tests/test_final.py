@@ -0,0 +1,93 @@
+import asyncio
+
+import errors
+import final
+from final import prioritize_about_pages
+
+
+def test_spellings_of_one_about_page_are_read_once():
+    links = [
+        "https://x.com/about",
+        "http://www.x.com/about",
+        "https://x.com/about/",
+        "/about#team",
+        "/company/history",
+    ]
+
+    assert prioritize_about_pages("https://x.com", links) == [
+        "https://x.com/about",
+        "https://x.com/company/history",
+    ]
+
+
+class FakeSite:
+    """Stands in for discover_async, the homepage links and the page reads"""
+
+    def __init__(self, monkeypatch, sitemap, links, pages) -> None:
+        self.read = []
+        self.pages = pages
+
+        async def discover_async(fetcher, url, user_agent):
+            return sitemap
+
+        async def get_all_urls_async(fetcher, url, user_agent):
+            return links
+
+        monkeypatch.setattr(final, "discover_async", discover_async)
+        monkeypatch.setattr(final, "get_all_urls_async", get_all_urls_async)
+        monkeypatch.setattr(final, "_read_candidate", self.read_candidate)
+
+    async def read_candidate(self, fetcher, url):
+        self.read.append(url)
+        page = self.pages[url]
+        if isinstance(page, Exception):
+            raise page
+        return url, page, page.startswith("Our purpose")
+
+    def scrape(self):
+        async def run():
+            with errors.capture() as failure:
+                result = await final.scrape_async(None, "https://x.com", "test")
+            return result, failure.error_class
+
+        return asyncio.run(run())
+
+
+def test_failed_sitemap_pages_do_not_decide_the_outcome(monkeypatch):
+    site = FakeSite(
+        monkeypatch,
+        sitemap=["https://x.com/about"],
+        links=["/products"],
+        pages={"https://x.com/about": ConnectionError("refused")},
+    )
+
+    assert site.scrape() == (None, None)
+
+
+def test_the_page_actually_read_is_kept(monkeypatch):
+    site = FakeSite(
+        monkeypatch,
+        sitemap=["https://x.com/about", "https://x.com/company"],
+        links=["/products"],
+        pages={
+            "https://x.com/about": ConnectionError("refused"),
+            "https://x.com/company": "We make widgets",
+        },
+    )
+
+    assert site.scrape() == (("https://x.com/company", "We make widgets"), None)
+
+
+def test_the_homepage_links_are_read_when_the_sitemap_pages_fail(monkeypatch):
+    site = FakeSite(
+        monkeypatch,
+        sitemap=["https://x.com/about"],
+        links=["/about-us"],
+        pages={
+            "https://x.com/about": ConnectionError("refused"),
+            "https://x.com/about-us": "Our purpose is widgets",
+        },
+    )
+
+    assert site.scrape() == (("https://x.com/about-us", "Our purpose is widgets"), None)
+    assert site.read == ["https://x.com/about", "https://x.com/about-us"]
@@ -0,0 +1,31 @@
+from passages import PAGE_SEPARATOR, page_text, select_passages
+
+ABOUT = page_text(
+    "About us\n"
+    "Our purpose is to make widgets that last a lifetime.\n"
+    "We were founded in 1920 by two engineers in Lyon."
+)
+FOOTER = page_text("Copyright Widgets Inc. All rights reserved worldwide.")
+
+
+def test_the_same_page_read_twice_is_kept():
+    once = select_passages(ABOUT, 1000)
+    twice = select_passages(PAGE_SEPARATOR.join([ABOUT, ABOUT]), 1000)
+
+    assert "our purpose is to make widgets" in once
+    assert twice == once
+
+
+def test_boilerplate_shared_by_the_pages_is_dropped():
+    other = page_text("Careers at Widgets: join a team of passionate makers.")
+    text = PAGE_SEPARATOR.join([ABOUT + "\n" + FOOTER, other + "\n" + FOOTER])
+
+    selected = select_passages(text, 1000)
+    assert "our purpose is to make widgets" in selected
+    assert "copyright" not in selected
+
+
+def test_pages_sharing_every_passage_still_give_text():
+    text = PAGE_SEPARATOR.join([ABOUT + "\n" + FOOTER, FOOTER + "\n" + ABOUT])
+
+    assert "our purpose is to make widgets" in select_passages(text, 1000)
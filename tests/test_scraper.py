@@ -0,0 +1,61 @@
+import scraper
+from extract import ParsedPage
+
+SITE = "http://x.com/"
+
+PAGES = {
+    SITE: ParsedPage(
+        links=[
+            ("http://x.com:80a/about", "About"),
+            ("http://x.com:99999/about", "About"),
+            ("http://[::1/about", "About"),
+            ("/company", "Company"),
+        ],
+        text="Welcome",
+    ),
+    "http://x.com/company": ParsedPage(links=[], text="About us: we make widgets"),
+}
+
+
+def test_malformed_links_are_skipped(monkeypatch):
+    visited = []
+
+    def fetch_page(url):
+        visited.append(url)
+        return PAGES[url], 100
+
+    monkeypatch.setattr(scraper, "fetch_page", fetch_page)
+    monkeypatch.setattr(
+        scraper, "has_about_text", lambda page: page.text.startswith("About")
+    )
+
+    assert scraper.extract_site_info(SITE) == "http://x.com/company"
+    assert visited == [SITE, "http://x.com/company"]
+
+
+def test_a_failing_site_is_saved_and_the_crawl_goes_on(monkeypatch):
+    saved = []
+    crawled = []
+
+    def scrape(url, site_deadline):
+        if url == "http://bad.com":
+            raise ValueError("Port out of range 0-65535")
+        crawled.append(url)
+
+    monkeypatch.setattr(scraper, "scrape", scrape)
+    monkeypatch.setattr(
+        scraper,
+        "load_by_batch_in_memory",
+        lambda *args: iter([[("A", "http://bad.com"), ("B", "http://good.com")]]),
+    )
+    monkeypatch.setattr(
+        scraper, "save_to_db", lambda *args, **kwargs: saved.append(args)
+    )
+    monkeypatch.setattr(scraper, "release_claims", lambda worker_id: None)
+    monkeypatch.setattr(scraper, "close_db", lambda: None)
+    monkeypatch.setattr(scraper, "ARCHIVE_DIR", None)
+
+    scraper.scrape_sites(worker_id="test")
+
+    assert crawled == ["http://good.com"]
+    assert saved == [("http://bad.com", "", "ERROR", "OTHER")]
@@ -0,0 +1,35 @@
+import sqlite3
+import threading
+
+import db
+
+
+def test_a_batch_is_retried_while_the_database_is_locked(tmp_path, monkeypatch):
+    path = str(tmp_path / "database.db")
+    db.create_db_and_table(path)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    db.upsert_companies([("A", "Widgets", "Industry", "http://a.com")], conn)
+
+    open_connection = db._open_connection
+
+    def impatient_connection(name):
+        # Give up on the lock at once instead of after the busy timeout
+        connection = open_connection(name)
+        connection.execute("PRAGMA busy_timeout = 10")
+        return connection
+
+    monkeypatch.setattr(db, "_open_connection", impatient_connection)
+    store = db.WriteBehindStore(path, flush_interval=0.01, retry_delay=0.05)
+    monkeypatch.setattr(db, "STORE", store)
+
+    # Another crawler process holds the write lock for a while
+    conn.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.3, conn.commit).start()
+    db.save_to_db("http://a.com", "http://a.com/about", status="SCRAPED")
+    store.close()
+
+    status = conn.execute("SELECT status FROM companies WHERE ric = 'A'").fetchone()
+    conn.close()
+    assert status == ("SCRAPED",)
+    assert store.rows_written == 1